@@ -0,0 +1,214 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import executor_retry_after, read_executor_queue, read_executor_workers, roster_page_size, \
+    search_page_size, write_executor_queue, write_executor_workers
+
+
+class ServiceOverloaded(Exception):
+    def __init__(self, lane, retry_after):
+        super().__init__(f'The {lane} queue is full; retry after {retry_after}s')
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    A thread pool that accepts at most max_workers + max_queue calls at a time and rejects the rest
+    with ServiceOverloaded instead of queueing them without limit.
+    """
+
+    def __init__(self, name, max_workers, max_queue, retry_after=executor_retry_after):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'biography-{name}')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {'submitted': 0, 'completed': 0, 'rejected': 0}
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+            self._counters['completed'] += 1
+        self._slots.release()
+
+    async def run(self, func, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise ServiceOverloaded(self.name, self.retry_after)
+
+        try:
+            future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_flight += 1
+            self._counters['submitted'] += 1
+        # the slot is released when the work itself finishes, not when the awaiting request goes away
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                **self._counters
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+class AsyncUserBiographySystem:
+    """
+    Async facade over UserBiographySystem: every call runs in a bounded thread pool so the event loop
+    is never blocked by SQLite queries or photo writes.
+    """
+
+    def __init__(self, biography_system):
+        self.biography_system = biography_system
+        self.read_executor = BoundedExecutor('read', read_executor_workers, read_executor_queue)
+        self.write_executor = BoundedExecutor('write', write_executor_workers, write_executor_queue)
+
+    async def generate_invitation_link(self, event_name):
+        return await self.write_executor.run(self.biography_system.generate_invitation_link, event_name=event_name)
+
+    async def retrieve_bio_by_email(self, user_email):
+        return await self.read_executor.run(self.biography_system.retrieve_bio_by_email, user_email=user_email)
+
+    async def retrieve_bio_by_id(self, bio_id):
+        return await self.read_executor.run(self.biography_system.retrieve_bio_by_id, bio_id=bio_id)
+
+    async def retrieve_bio_by_id_if_modified(self, bio_id, is_current=None):
+        return await self.read_executor.run(self.biography_system.retrieve_bio_by_id_if_modified, bio_id,
+                                            is_current=is_current)
+
+    async def retrieve_bios(self, emails=None, biography_ids=None):
+        return await self.read_executor.run(self.biography_system.retrieve_bios, emails=emails,
+                                            biography_ids=biography_ids)
+
+    async def get_event(self):
+        return await self.read_executor.run(self.biography_system.get_event)
+
+    async def get_events_overview(self, limit, cursor=None):
+        return await self.read_executor.run(self.biography_system.get_events_overview, limit=limit, cursor=cursor)
+
+    async def retrieve_bios_by_event(self, event_id, biography_status):
+        return await self.read_executor.run(self.biography_system.retrieve_bios_by_event, event_id, biography_status)
+
+    async def retrieve_bios_by_event_if_modified(self, event_id, biography_status, is_current=None):
+        return await self.read_executor.run(self.biography_system.retrieve_bios_by_event_if_modified, event_id,
+                                            biography_status, is_current=is_current)
+
+    async def retrieve_bios_by_event_page(self, event_id, biography_status, limit, cursor=None, fields=None):
+        return await self.read_executor.run(self.biography_system.retrieve_bios_by_event_page, event_id,
+                                            biography_status, limit=limit, cursor=cursor, fields=fields)
+
+    async def check_roster_stream(self, event_id, biography_status, fields=None):
+        return await self.read_executor.run(self.biography_system.check_roster_stream, event_id, biography_status,
+                                            fields=fields)
+
+    async def iter_batches(self, read_batch):
+        """
+        Async generator over the batches of a keyset-paged read: read_batch(after) returns (batch, key of its
+        last row or None after the last batch). Every batch is read in the read executor on a connection of its
+        own, so a slow client holds neither a connection nor a worker thread between batches, and a client
+        that goes away leaves nothing to close.
+        """
+        after = None
+        while True:
+            batch, after = await self.read_executor.run(read_batch, after=after)
+            if batch:
+                yield batch
+            if after is None:
+                break
+
+    def iter_bios_by_event(self, event_id, biography_status, fields=None, batch_size=200):
+        return self.iter_batches(functools.partial(self.biography_system.read_roster_batch, event_id,
+                                                   biography_status, fields=fields, batch_size=batch_size))
+
+    async def check_export(self, table=None, event_id=None, biography_status=None, file_format='csv'):
+        return await self.read_executor.run(self.biography_system.check_export, table=table, event_id=event_id,
+                                            biography_status=biography_status, file_format=file_format)
+
+    def iter_export(self, table=None, event_id=None, biography_status=None, file_format='csv', batch_size=200):
+        return self.iter_batches(functools.partial(self.biography_system.read_export_batch, table=table,
+                                                   event_id=event_id, biography_status=biography_status,
+                                                   file_format=file_format, batch_size=batch_size))
+
+    async def search_bios(self, query, biography_status='validated', event_id=None, filters=None,
+                          limit=search_page_size, cursor=None):
+        return await self.read_executor.run(self.biography_system.search_bios, query,
+                                            biography_status=biography_status, event_id=event_id, filters=filters,
+                                            limit=limit, cursor=cursor)
+
+    async def retrieve_bios_by_keyword(self, keyword, biography_status='validated', event_id=None,
+                                       limit=roster_page_size, cursor=None, fields=None):
+        return await self.read_executor.run(self.biography_system.retrieve_bios_by_keyword, keyword,
+                                            biography_status=biography_status, event_id=event_id, limit=limit,
+                                            cursor=cursor, fields=fields)
+
+    async def get_keyword_facets(self, event_id, biography_status='validated'):
+        return await self.read_executor.run(self.biography_system.get_keyword_facets, event_id,
+                                            biography_status=biography_status)
+
+    async def get_itu_keywords(self, query, top_x=10):
+        return await self.read_executor.run(self.biography_system.get_itu_keywords, query, top_x=top_x)
+
+    async def append_bio_to_event(self, event_id, bio_email):
+        return await self.write_executor.run(self.biography_system.append_bio_to_event, event_id, bio_email)
+
+    async def remove_bio_from_event(self, event_id, bio_email):
+        return await self.write_executor.run(self.biography_system.remove_bio_from_event, event_id, bio_email)
+
+    async def append_bios_to_event(self, event_id, bio_emails):
+        return await self.write_executor.run(self.biography_system.append_bios_to_event, event_id, bio_emails)
+
+    async def remove_bios_from_event(self, event_id, bio_emails):
+        return await self.write_executor.run(self.biography_system.remove_bios_from_event, event_id, bio_emails)
+
+    async def save_biography(self, user_bio, user_photo, event_id, photo_flag):
+        return await self.write_executor.run(self.biography_system.save_biography, user_bio, user_photo, event_id,
+                                             photo_flag)
+
+    async def accept_biography(self, user_bio, user_photo, photo_flag):
+        return await self.write_executor.run(self.biography_system.accept_biography, user_bio, user_photo,
+                                             photo_flag)
+
+    async def accept_biographies(self, emails=None, biography_ids=None, event_id=None):
+        return await self.write_executor.run(self.biography_system.accept_biographies, emails=emails,
+                                             biography_ids=biography_ids, event_id=event_id)
+
+    async def import_biographies(self, source, file_format, event_id, biography_status='pending'):
+        return await self.write_executor.run(self.biography_system.import_biographies, source, file_format,
+                                             event_id, biography_status=biography_status)
+
+    def get_executor_stats(self):
+        return {
+            'read': self.read_executor.stats(),
+            'write': self.write_executor.stats()
+        }
+
+    def get_stats(self):
+        return {
+            'db_pool': self.biography_system.get_db_stats(),
+            'cache': self.biography_system.get_cache_stats(),
+            'photo_pipeline': self.biography_system.photo_pipeline.stats(),
+            'snapshots': self.biography_system.snapshots.stats(),
+            **{f'{lane}_executor': stats for lane, stats in self.get_executor_stats().items()}
+        }
+
+    def close(self):
+        self.read_executor.shutdown()
+        self.write_executor.shutdown()
+        self.biography_system.close()
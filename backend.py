@@ -1,10 +1,25 @@
+import functools
+import json
 import os
 import shutil
-import sqlite3
+import tempfile
+from operator import itemgetter
 
 from werkzeug.utils import secure_filename
 
-from config import bio_save_path, invitation_link_base, profile_photo_url_base, profile_url_base
+from cache import LRUCache
+from bulk import bulk_formats, iter_export_lines, iter_import_rows
+from config import bio_lookup_max_items, bio_save_path, cache_data_version_interval, cache_max_size, cache_ttl, \
+    db_pool_size, db_pool_timeout, db_pragmas, db_write_lock_file, events_page_max_size, events_page_size, \
+    import_batch_size, invitation_link_base, photo_max_size, photo_uploads_dir_name, photo_variants_dir_name, \
+    profile_photo_url_base, profile_url_base, roster_page_max_size, roster_page_size, search_page_max_size, \
+    search_page_size, snapshot_save_path, upload_chunk_size
+from database import SQLiteConnectionPool
+from image_pipeline import PhotoVariantPipeline, get_variant_urls
+from keyword_index import KeywordIndex
+from metrics import photo_io_seconds
+from migrations import apply_migrations
+from snapshots import SnapshotPublisher
 from utils import *
 
 biography_cols = ["BiographyID",
@@ -26,22 +41,170 @@ biography_cols = ["BiographyID",
                   "GoogleScholarProfile",
                   "Gender",
                   "Keywords",
-                  "Biography"
+                  "Biography",
+                  "PhotoHash"
                   ]
 
+# keyset order of the events overview, and the fields of one of its events
+events_key_cols = ["CreateDate", "EventID"]
+events_overview_cols = ["EventID", "EventName", "CreateDate", "LastActivity", "PendingCount", "ValidatedCount"]
+# the API shape of a full biography row: PhotoHash is replaced by the PhotoVariants URLs
+biography_fields = [col for col in biography_cols if col != "PhotoHash"] + ["PhotoVariants"]
+# keyset order of paginated rosters, and the fields a roster row can be projected to: those of a validated bio
+roster_key_cols = ["LastName", "FirstName", "BiographyID"]
+roster_fields = biography_fields + ["ProfileULR"]
+
+# columns a bulk import sets; IDs are generated (or kept for known emails) and photos are uploaded separately.
+# The other columns of an exported biography table are accepted and ignored, so exports can be imported again.
+import_cols = [col for col in biography_cols if col not in ["BiographyID", "PersonalPhotoName", "PhotoHash"]]
+ignored_import_cols = ["BiographyID", "PersonalPhotoName", "PhotoHash", "CreateDate", "LastUpdate", "Revision"]
+required_import_cols = ["Email", "FirstName", "LastName"]
+# columns of a search hit, next to its Snippet and ProfileULR
+search_result_cols = ["BiographyID", "FirstName", "LastName", "Title", "JobTitle", "Organization", "Country", "Region",
+                      "Keywords", "PersonalPhotoName", "PhotoHash"]
+search_result_fields = [col for col in search_result_cols if col != "PhotoHash"] + ["PhotoVariants", "Snippet"]
+search_filter_cols = ["Country", "Region", "Gender"]
+export_tables = ['biography_pending', 'biography_validated', 'events', 'event_biography', 'itu_keywords']
+# os.path.join(<base>, '') once, so that building a URL per row is a concatenation
+profile_url_prefix = os.path.join(profile_url_base, '')
+profile_photo_url_prefix = os.path.join(profile_photo_url_base, '')
+
+
+@functools.lru_cache(maxsize=256)
+def get_row_projector(cols, fields):
+    """
+    A function turning a row selected as cols (a tuple) into the API dict of fields (a tuple) in one pass:
+    Keywords as a list, PersonalPhotoName as its URL, PhotoVariants from PhotoHash and ProfileULR from
+    BiographyID. The column positions are worked out once per (cols, fields) instead of per row.
+    """
+    position = {col: index for index, col in enumerate(cols)}
+    # a derived field is first filled with its source column, which keeps the keys in the order of fields
+    source_cols = {"PhotoVariants": "PhotoHash", "ProfileULR": "BiographyID"}
+    get_values = itemgetter(*[position[source_cols.get(field, field)] for field in fields])
+    if len(fields) == 1:
+        get_values = (lambda getter: lambda row: (getter(row),))(get_values)
+    id_position = position.get("BiographyID")
+    with_keywords, with_photo, with_variants, with_profile_url = (
+        field in fields for field in ["Keywords", "PersonalPhotoName", "PhotoVariants", "ProfileULR"])
+
+    def project(row):
+        biography = dict(zip(fields, get_values(row)))
+        if with_keywords:
+            biography["Keywords"] = str2list(biography["Keywords"])
+        if with_photo and biography["PersonalPhotoName"]:
+            biography["PersonalPhotoName"] = (f'{profile_photo_url_prefix}{row[id_position]}/profile_photo/'
+                                              f'{biography["PersonalPhotoName"]}')
+        elif with_photo:
+            biography["PersonalPhotoName"] = ''
+        if with_variants:
+            biography["PhotoVariants"] = get_variant_urls(biography["PhotoVariants"])
+        if with_profile_url:
+            biography["ProfileULR"] = profile_url_prefix + biography["ProfileULR"]
+        return biography
+
+    return project
+
 
 class UserBiographySystem:
     def __init__(self, database_path):
         self.database_path = database_path
+        self.db_pool = SQLiteConnectionPool(database_path, max_size=db_pool_size, timeout=db_pool_timeout,
+                                            pragmas=db_pragmas, write_lock_file=db_write_lock_file,
+                                            data_version_interval=cache_data_version_interval)
+        self.keyword_index = KeywordIndex()
+        # other processes write to the same database: their commits move data_version, which sends the
+        # entries loaded before them back through revalidation; this process's own writes invalidate by key
+        self.cache = LRUCache(max_size=cache_max_size, ttl=cache_ttl, generation=self.db_pool.data_version.current)
+        self.photo_pipeline = PhotoVariantPipeline(os.path.join(bio_save_path, photo_variants_dir_name),
+                                                   on_ready=self.set_photo_hash)
+        self.snapshots = SnapshotPublisher(snapshot_save_path, list_items=self.list_snapshot_items, loaders={
+            'events': functools.partial(self._retrieve_bios_by_event, biography_status='validated'),
+            'bios': self._retrieve_bio_by_id
+        })
+        with self.get_db() as conn:
+            apply_migrations(conn)
+            self.keyword_index.load(conn)
+
+    def get_db(self):
+        return self.db_pool.connection()
+
+    def get_db_stats(self):
+        return self.db_pool.stats()
+
+    def get_cache_stats(self):
+        return self.cache.stats()
+
+    def cached(self, key, loader):
+        # error responses are not cached: they depend on state (e.g. the event) that is not part of the key
+        return self.cache.get_or_load(key, loader, cacheable=lambda response: not response['error_msg'])
+
+    def cached_with_version(self, key, loader, get_version):
+        # loader returns (response, version), read together so that a cached body never gets a newer ETag;
+        # after a write elsewhere the entry is kept as long as get_version(conn) still returns its version
+        def revalidate(value):
+            with self.get_db() as conn:
+                return value[1] is not None and get_version(conn) == value[1]
+
+        return self.cache.get_or_load(key, loader, cacheable=lambda value: not value[0]['error_msg'],
+                                      revalidate=revalidate)
+
+    def invalidate(self, *keys):
+        self.cache.invalidate(*keys)
+        self.mark_snapshots(keys)
+
+    def mark_snapshots(self, cache_keys):
+        # the snapshots are of validated rosters and bios, so only those cache keys make them stale
+        self.snapshots.mark('events', [key[1] for key in cache_keys if key[0] == 'event_bios' and
+                                       key[2] == 'validated'])
+        self.snapshots.mark('bios', [key[1] for key in cache_keys if key[0] == 'bio_id'])
+
+    def list_snapshot_items(self):
+        with self.get_db() as conn:
+            return {'events': [row[0] for row in conn.execute('SELECT EventID FROM events')],
+                    'bios': [row[0] for row in conn.execute('SELECT BiographyID FROM biography_validated')]}
 
     @staticmethod
-    def get_photo_path(photo_name, biography_id):
-        if photo_name:
-            return os.path.join(profile_photo_url_base, biography_id, 'profile_photo', photo_name)
-        return ''
+    def get_bio_event_ids(conn, biography_id):
+        return [row['EventID'] for row in sqlite_select(conn=conn, table='event_biography', cols=['EventID'],
+                                                         conds={'BiographyID': biography_id})]
 
-    def get_db(self):
-        return sqlite3.connect(self.database_path)
+    @staticmethod
+    def roster_cache_keys(event_ids, statuses=('pending', 'validated')):
+        return [('event_bios', event_id.lower(), status) for event_id in event_ids for status in statuses]
+
+    def bio_cache_keys(self, conn, biography_ids, emails):
+        bio_ids = {bio_id.lower() for bio_id in biography_ids}
+        event_ids = {event_id for bio_id in bio_ids for event_id in self.get_bio_event_ids(conn, bio_id)}
+        return [*[('bio_email', email.lower()) for email in emails],
+                *[('bio_id', bio_id) for bio_id in bio_ids],
+                *self.roster_cache_keys(event_ids)]
+
+    def set_photo_hash(self, biography_id, photo_name, photo_hash):
+        """
+        Called by the photo pipeline once the variants of photo_name exist. Only a bio still showing that
+        photo is updated, so a late result for a replaced photo is dropped.
+        """
+        with self.get_db() as conn:
+            with transaction(conn):
+                emails = []
+                for table in ['biography_pending', 'biography_validated']:
+                    if sqlite_update(conn=conn, table=table, rows={'PhotoHash': photo_hash},
+                                     conds={'BiographyID': biography_id, 'PersonalPhotoName': photo_name}):
+                        emails += [row['Email'] for row in sqlite_select(conn=conn, table=table, cols=['Email'],
+                                                                         conds={'BiographyID': biography_id})]
+                stale_keys = self.bio_cache_keys(conn, [biography_id], emails) if emails else []
+        # invalidated after the commit, so a concurrent read cannot cache the state from before it
+        self.invalidate(*stale_keys)
+
+    def close(self):
+        # each step runs even when an earlier one fails, so the pool is always closed
+        try:
+            self.photo_pipeline.close()
+        finally:
+            try:
+                self.snapshots.close()
+            finally:
+                self.db_pool.close()
 
     def generate_invitation_link(self, event_name):
         even_id = generate_id(key=event_name)
@@ -49,19 +212,20 @@ class UserBiographySystem:
         event_cols = ['EventID', 'EventName']
 
         try:
-            conn = self.get_db()
-            events = sqlite_select(conn=conn, table='events', cols=event_cols, conds={'EventName': event_name})
-            if len(events) > 0:
-                even_id = events[0].get('EventID')
-                link = os.path.join(invitation_link_base, even_id)
-                return form_response(data={'link': link}, success_msg=f'Event {event_name} already exits')
-
-            affected_rows = sqlite_insert(conn=conn, table='events', rows={
-                'EventName': event_name,
-                'EventID': even_id
-            })
+            with self.get_db() as conn, transaction(conn):
+                events = sqlite_select(conn=conn, table='events', cols=event_cols, conds={'EventName': event_name})
+                if len(events) > 0:
+                    even_id = events[0].get('EventID')
+                    link = os.path.join(invitation_link_base, even_id)
+                    return form_response(data={'link': link}, success_msg=f'Event {event_name} already exits')
+
+                affected_rows = sqlite_insert(conn=conn, table='events', rows={
+                    'EventName': event_name,
+                    'EventID': even_id
+                })
             link = os.path.join(invitation_link_base, even_id)
             if affected_rows:
+                self.invalidate(('events',))
                 return form_response(data={'link': link}, success_msg=f'Event {event_name} has been created')
             return form_response(data={}, error_msg=f'Event {event_name} was not created')
 
@@ -70,291 +234,1081 @@ class UserBiographySystem:
             return form_response(data=None, error_msg=error_msg)
 
     def retrieve_bio_by_email(self, user_email):
-
-        conn = self.get_db()
         user_email = user_email.lower()
-        biography = sqlite_select(conn=conn, table='biography_pending', cols=biography_cols,
-                                  conds={'Email': user_email})
-        if biography:
-            biography = biography[0]
-            biography['Keywords'] = str2list(biography['Keywords'])
-            biography['PersonalPhotoName'] = self.get_photo_path(biography_id=biography.get('BiographyID'),
-                                                                 photo_name=biography.get('PersonalPhotoName'))
-            return form_response(data=biography, success_msg='success')
-
-        biography = sqlite_select(conn=conn, table='biography_validated', cols=biography_cols,
-                                  conds={'Email': user_email})
-        if biography:
-            biography = biography[0]
-            biography['Keywords'] = str2list(biography['Keywords'])
-            biography['PersonalPhotoName'] = self.get_photo_path(biography_id=biography.get('BiographyID'),
-                                                                 photo_name=biography.get('PersonalPhotoName'))
-            biography['ProfileULR'] = os.path.join(profile_url_base, biography.get('BiographyID'))
-            return form_response(data=biography, success_msg='success')
-        else:
+        return self.cached(('bio_email', user_email), lambda: self._retrieve_bio_by_email(user_email))
+
+    def _retrieve_bio_by_email(self, user_email):
+
+        cols = ', '.join(f'"{col}"' for col in biography_cols)
+        with self.get_db() as conn:
+            # the pending bio first; only a validated bio has a profile page
+            for biography_status, fields in [('pending', biography_fields), ('validated', roster_fields)]:
+                table = f'biography_{biography_status}'
+                sql = f'SELECT {cols} FROM {table} WHERE Email=:Email'
+                with timed_query(conn, 'select', table, sql, {'Email': user_email}):
+                    row = conn.cursor().execute(sql, {'Email': user_email}).fetchone()
+                if row:
+                    biography = get_row_projector(tuple(biography_cols), tuple(fields))(row)
+                    return form_response(data=biography, success_msg='success')
             return form_response(data={}, success_msg='success')
 
     def retrieve_bio_by_id(self, bio_id):
+        return self.retrieve_bio_by_id_if_modified(bio_id)[0]
 
-        conn = self.get_db()
+    def retrieve_bio_by_id_if_modified(self, bio_id, is_current=None):
+        """
+        (response, version) of retrieve_bio_by_id, version being the bio's form_version (None without a bio).
+        When is_current(version) holds for the stored version, the client's copy is up to date and the
+        response is None: it is neither loaded nor built.
+        """
         bio_id = bio_id.lower()
-        biography = sqlite_select(conn=conn, table='biography_validated', cols=biography_cols,
-                                  conds={'BiographyID': bio_id})
-        if biography:
-            biography = biography[0]
-            biography['Keywords'] = str2list(biography['Keywords'])
-            biography['ProfileULR'] = os.path.join(profile_url_base, biography.get('BiographyID'))
-            biography['PersonalPhotoName'] = self.get_photo_path(biography_id=biography.get('BiographyID'),
-                                                                 photo_name=biography.get('PersonalPhotoName'))
-            return form_response(data=biography, success_msg='success')
-        else:
-            return form_response(data={}, success_msg='success')
+        if is_current is not None:
+            with self.get_db() as conn:
+                version = self.get_bio_version(conn, bio_id)
+            if version and is_current(version):
+                return None, version
+        return self.cached_with_version(('bio_id', bio_id), lambda: self._retrieve_bio_by_id(bio_id),
+                                        lambda conn: self.get_bio_version(conn, bio_id))
+
+    @staticmethod
+    def get_bio_version(conn, bio_id):
+        rows = sqlite_select(conn=conn, table='biography_validated', cols=['Revision', 'LastUpdate'],
+                             conds={'BiographyID': bio_id})
+        return form_version(rows[0]['Revision'], rows[0]['LastUpdate']) if rows else None
+
+    def _retrieve_bio_by_id(self, bio_id):
+
+        cols = ', '.join(f'"{col}"' for col in [*biography_cols, 'Revision', 'LastUpdate'])
+        sql = f'SELECT {cols} FROM biography_validated WHERE BiographyID=:BiographyID'
+        with self.get_db() as conn, timed_query(conn, 'select', 'biography_validated', sql, {'BiographyID': bio_id}):
+            row = conn.cursor().execute(sql, {'BiographyID': bio_id}).fetchone()
+        if not row:
+            return form_response(data={}, success_msg='success'), None
+        biography = get_row_projector(tuple(biography_cols), tuple(roster_fields))(row)
+        return form_response(data=biography, success_msg='success'), form_version(*row[-2:])
+
+    def retrieve_bios(self, emails=None, biography_ids=None):
+        """
+        Batch retrieve_bio_by_email / retrieve_bio_by_id: one UNION query over both biography tables,
+        returning {input: biography} with each bio's BiographyStatus, or {} for inputs without a bio. As in
+        the single lookups an email resolves to its pending bio first, an ID to its validated bio first.
+        """
+        if (emails is None) == (biography_ids is None):
+            return form_response(data={}, error_msg='pass either emails or biography_ids.')
+        key, items = ('Email', emails) if emails is not None else ('BiographyID', biography_ids)
+        if len(items) > bio_lookup_max_items:
+            return form_response(data={}, error_msg=f'at most {bio_lookup_max_items} items per request.')
+
+        cols = ', '.join(biography_cols)
+        sql = f"""
+        SELECT 'pending', {cols} FROM biography_pending WHERE {key} IN (SELECT value FROM json_each(:items))
+        UNION ALL
+        SELECT 'validated', {cols} FROM biography_validated WHERE {key} IN (SELECT value FROM json_each(:items))
+        """
+        params = {'items': json.dumps([item.lower() for item in items])}
+        with self.get_db() as conn, timed_query(conn, 'lookup', 'biography_*', sql, params):
+            rows = conn.cursor().execute(sql, params).fetchall()
+
+        preferred_status = 'pending' if key == 'Email' else 'validated'
+        key_position = biography_cols.index(key) + 1
+        found = {}
+        for row in rows:
+            item = row[key_position].lower()
+            if item not in found or row[0] == preferred_status:
+                found[item] = row
+
+        biographies = {}
+        for item in items:
+            row = found.get(item.lower())
+            biographies[item] = self.biography_response_data(row[1:], status=row[0]) if row else {}
+        return form_response(data=biographies, success_msg='success')
+
+    @staticmethod
+    def biography_response_data(row, status):
+        fields = roster_fields if status == 'validated' else biography_fields
+        biography = get_row_projector(tuple(biography_cols), tuple(fields))(row)
+        biography['BiographyStatus'] = status
+        return biography
 
     def accept_biography(self, user_bio, user_photo, photo_flag):
-        conn = self.get_db()
-        user_email = user_bio.get('Email', '').lower()
-
-        already_exists_user = sqlite_select(conn,
-                                            table='biography_pending',
-                                            cols=['BiographyID', 'PersonalPhotoName'],
-                                            conds={'Email': f'{user_email}'})
-        if already_exists_user:
-            biography_id = already_exists_user[0].get('BiographyID')
-            personal_photo_name = already_exists_user[0].get('PersonalPhotoName')
-        else:
-            return form_response(data={},
-                                 error_msg='email was not found in the pending profiles; '
-                                           'maybe already accepted or you inserted an invalid email.')
-
-        photo_folder_path = os.path.join(bio_save_path, biography_id, 'profile_photo')
-        os.makedirs(photo_folder_path, exist_ok=True)
-        personal_photo_name = self.save_user_profile_photo(photo_folder_path, user_photo,
-                                                           photo_flag,
-                                                           personal_photo_name)
-
-        affected_rows_b = sqlite_insert(conn=conn, table='biography_validated', replace_existing=True, rows={
-            "FirstName": user_bio.get('FirstName'),
-            "LastName": user_bio.get('LastName'),
-            "Title": user_bio.get('Title'),
-            "JobTitle": user_bio.get('JobTitle'),
-            "Email": user_bio.get('Email', '').lower(),
-            "Country": user_bio.get('Country'),
-            "LinkedInPage": user_bio.get('LinkedInPage'),
-            "TwitterPage": user_bio.get('TwitterPage'),
-            "FacebookPage": user_bio.get('FacebookPage'),
-            "SocialNetworkPage": user_bio.get('SocialNetworkPage'),
-            "BiographyID": biography_id,
-            "PersonalPhotoName": personal_photo_name,
-            "IEEEPage": user_bio.get('IEEEPage'),
-            "PersonalWebPage": user_bio.get('PersonalWebPage'),
-            "Organization": user_bio.get('Organization'),
-            "Region": user_bio.get('Region'),
-            "GoogleScholarProfile": user_bio.get('GoogleScholarProfile'),
-            "Gender": user_bio.get('Gender'),
-            "Keywords": list2str(user_bio.get('Keywords')),
-            "Biography": user_bio.get('Biography'),
-        })
-        sqlite_delete(conn=conn, table='biography_pending', conds={"BiographyID": biography_id})
+        try:
+            upload = self.receive_user_profile_photo(user_photo)
+        except PhotoUploadError as ex:
+            return form_response(data={}, error_msg=str(ex))
+        try:
+            response, biography_id, personal_photo_name = self._accept_biography(user_bio, upload, photo_flag)
+            if biography_id is not None:
+                photo_folder_path = os.path.join(bio_save_path, biography_id, 'profile_photo')
+                if self.store_user_profile_photo(photo_folder_path, upload, photo_flag):
+                    upload = None
+                    self.photo_pipeline.submit(biography_id, photo_folder_path, personal_photo_name)
+            return response
+        finally:
+            self.discard_user_profile_photo(upload)
+
+    def _accept_biography(self, user_bio, upload, photo_flag):
+        # one transaction: a failure can no longer leave the bio in both tables. Returns the response, and the
+        # BiographyID and photo name when the bio was written.
+        with self.get_db() as conn, transaction(conn):
+            user_email = user_bio.get('Email', '').lower()
+
+            already_exists_user = sqlite_select(conn,
+                                                table='biography_pending',
+                                                cols=['BiographyID', 'PersonalPhotoName', 'PhotoHash'],
+                                                conds={'Email': f'{user_email}'})
+            if already_exists_user:
+                biography_id = already_exists_user[0].get('BiographyID')
+                personal_photo_name = already_exists_user[0].get('PersonalPhotoName')
+                photo_hash = already_exists_user[0].get('PhotoHash')
+            else:
+                return form_response(data={},
+                                     error_msg='email was not found in the pending profiles; '
+                                               'maybe already accepted or you inserted an invalid email.'), None, None
+            # a validated bio with the same email but another ID is replaced by this one
+            replaced_ids = [row['BiographyID'] for row in sqlite_select(conn, table='biography_validated',
+                                                                        cols=['BiographyID'],
+                                                                        conds={'Email': user_email})]
+
+            personal_photo_name = self.get_profile_photo_name(upload, photo_flag, personal_photo_name)
+            if upload is not None or photo_flag:
+                # a new or removed photo has no variants (yet)
+                photo_hash = ''
+
+            affected_rows_b = sqlite_insert(conn=conn, table='biography_validated', replace_existing=True, rows={
+                "FirstName": user_bio.get('FirstName'),
+                "LastName": user_bio.get('LastName'),
+                "Title": user_bio.get('Title'),
+                "JobTitle": user_bio.get('JobTitle'),
+                "Email": user_bio.get('Email', '').lower(),
+                "Country": user_bio.get('Country'),
+                "LinkedInPage": user_bio.get('LinkedInPage'),
+                "TwitterPage": user_bio.get('TwitterPage'),
+                "FacebookPage": user_bio.get('FacebookPage'),
+                "SocialNetworkPage": user_bio.get('SocialNetworkPage'),
+                "BiographyID": biography_id,
+                "PersonalPhotoName": personal_photo_name,
+                "IEEEPage": user_bio.get('IEEEPage'),
+                "PersonalWebPage": user_bio.get('PersonalWebPage'),
+                "Organization": user_bio.get('Organization'),
+                "Region": user_bio.get('Region'),
+                "GoogleScholarProfile": user_bio.get('GoogleScholarProfile'),
+                "Gender": user_bio.get('Gender'),
+                "Keywords": list2str(user_bio.get('Keywords')),
+                "Biography": user_bio.get('Biography'),
+                "PhotoHash": photo_hash,
+            })
+            sqlite_delete(conn=conn, table='biography_pending', conds={"BiographyID": biography_id})
+
+            stale_keys = self.bio_cache_keys(conn, [biography_id, *replaced_ids], [user_email])
+        self.invalidate(*stale_keys)
 
         if affected_rows_b:
-            return form_response(data={}, success_msg='success; inserted')
+            return form_response(data={}, success_msg='success; inserted'), biography_id, personal_photo_name
+        return None, biography_id, personal_photo_name
 
-    @staticmethod
-    def save_user_profile_photo(image_save_dir, user_photo, photo_flag, personal_photo_name):
+    def accept_biographies(self, emails=None, biography_ids=None, event_id=None):
+        """
+        Moves many pending bios to biography_validated as they are, in one transaction: the bios with the
+        given emails, with the given BiographyIDs, or every pending bio of an event. Like accept_biography,
+        a validated bio with the same email is replaced. Returns the status of every requested item.
+        """
+        if sum(selector is not None for selector in [emails, biography_ids, event_id]) != 1:
+            return form_response(data={}, error_msg='pass exactly one of emails, biography_ids or event_id.')
 
-        if user_photo is None:
-            # if the photo_file is None --> the server did not send a file --> check what to do next based on the flag
-            # if the flag is True --> delete the file
-            if photo_flag:
-                if os.path.exists(image_save_dir):
-                    try:
-                        shutil.rmtree(image_save_dir)
-                        return ''
-                    except:
-                        return ''
+        cols = ', '.join(f'"{col}"' for col in biography_cols)
+        with self.get_db() as conn, transaction(conn):
+            if event_id is not None:
+                if not sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id}):
+                    return form_response(data={}, error_msg="invalid event ID.")
+                key = 'Email'
+                pending = conn.cursor().execute("""
+                SELECT biography_pending.BiographyID, biography_pending.Email
+                 FROM event_biography CROSS JOIN biography_pending
+                WHERE biography_pending.BiographyID=event_biography.BiographyID
+                AND event_biography.EventID=:EventID
+                """, {'EventID': event_id}).fetchall()
+                requested = items = [email for _, email in pending]
             else:
-                # if the flag is False --> keep/ no change
-                return personal_photo_name
-        else:
-            try:
-                if not allowed_photo_file(user_photo['filename']):
-                    error_msg = f'Not allowed image file type.'
-                    return None, error_msg
+                key = 'Email' if emails is not None else 'BiographyID'
+                requested = emails if emails is not None else biography_ids
+                items = [item.lower() for item in requested]
+                pending = conn.cursor().execute(f'SELECT BiographyID, Email FROM biography_pending '
+                                                f'WHERE {key} IN (SELECT value FROM json_each(:items))',
+                                                {'items': json.dumps(items)}).fetchall()
+
+            pending_ids = [biography_id for biography_id, _ in pending]
+            pending_emails = [email for _, email in pending]
+            validated = conn.cursor().execute(f'SELECT BiographyID, {key} FROM biography_validated '
+                                              f'WHERE {key} IN (SELECT value FROM json_each(:items))',
+                                              {'items': json.dumps(items)}).fetchall()
+            replaced_ids = [row[0] for row in conn.cursor().execute(
+                'SELECT BiographyID FROM biography_validated WHERE Email IN (SELECT value FROM json_each(:emails))',
+                {'emails': json.dumps(pending_emails)})]
 
-                # create a folder for user profile photo
-                if not os.path.exists(image_save_dir):
-                    os.makedirs(image_save_dir, exist_ok=True)
+            conn.execute(f'INSERT OR REPLACE INTO biography_validated ({cols}) SELECT {cols} FROM biography_pending '
+                         f'WHERE BiographyID IN (SELECT value FROM json_each(:ids))', {'ids': json.dumps(pending_ids)})
+            conn.execute('DELETE FROM biography_pending WHERE BiographyID IN (SELECT value FROM json_each(:ids))',
+                         {'ids': json.dumps(pending_ids)})
 
-                personal_photo_name = secure_filename(user_photo['filename'])
-                filepath = os.path.join(image_save_dir, personal_photo_name)
+            stale_keys = self.bio_cache_keys(conn, [*pending_ids, *replaced_ids], pending_emails)
+        self.invalidate(*stale_keys)
+
+        accepted = {(biography_id if key == 'BiographyID' else email).lower(): biography_id
+                    for biography_id, email in pending}
+        already_validated = {item.lower(): biography_id for biography_id, item in validated}
+        statuses = []
+        # the items are reported as the caller sent them, only matched case-insensitively
+        for item in dict.fromkeys(requested):
+            if item.lower() in accepted:
+                biography_id, status = accepted[item.lower()], 'accepted'
+            elif item.lower() in already_validated:
+                biography_id, status = already_validated[item.lower()], 'already validated'
+            else:
+                biography_id, status = None, 'not found'
+            # requested by ID, the item itself is the BiographyID and must stay in the response
+            statuses.append({key: item, 'status': status} if key == 'BiographyID' else
+                            {key: item, 'BiographyID': biography_id, 'status': status})
+        return form_response(data={'accepted': len(accepted), 'items': statuses},
+                             success_msg=f'success; {len(accepted)} accepted')
+
+    @staticmethod
+    def receive_user_profile_photo(user_photo):
+        """
+        user_photo is None or {'filename': ..., 'file': <binary file object>}. Copies the upload in
+        upload_chunk_size pieces to a temporary file under bio_save_path, before the write transaction is
+        opened, and returns (temporary path, photo name), or None without an upload. The path is None (and the
+        name '') when the file could not be written. Raises PhotoUploadError when the content is not an allowed
+        image type or exceeds photo_max_size.
+        """
+        if user_photo is None:
+            return None
+
+        source = user_photo['file']
+        first_chunk = source.read(upload_chunk_size)
+        # the content decides the type, not the name the client sent
+        photo_type = get_photo_type(first_chunk)
+        if photo_type is None:
+            raise PhotoUploadError('Not allowed image file type.')
+
+        personal_photo_name = secure_filename(user_photo['filename']) or 'profile_photo'
+        name, extension = os.path.splitext(personal_photo_name)
+        if get_photo_type_by_extension(extension) != photo_type:
+            personal_photo_name = f'{name}.{photo_type}'
+
+        temp_path = None
+        try:
+            # on the photos' file system, so that storing it is a rename
+            uploads_dir = os.path.join(bio_save_path, photo_uploads_dir_name)
+            os.makedirs(uploads_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=uploads_dir, prefix='.upload-')
+            size = 0
+            with photo_io_seconds.time(operation='store'), os.fdopen(fd, 'wb') as f:
+                chunk = first_chunk
+                while chunk:
+                    size += len(chunk)
+                    if size > photo_max_size:
+                        raise PhotoUploadError(f'Image file is larger than {photo_max_size // 1024} KB.')
+                    f.write(chunk)
+                    chunk = source.read(upload_chunk_size)
+            return temp_path, personal_photo_name
+        except PhotoUploadError:
+            os.remove(temp_path)
+            raise
+        except OSError:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None, ''
+
+    @staticmethod
+    def get_profile_photo_name(upload, photo_flag, personal_photo_name):
+        # the PersonalPhotoName to write: the upload's, none when photo_flag deletes the photo, or the current one
+        if upload is not None:
+            return upload[1]
+        return '' if photo_flag else personal_photo_name
+
+    @staticmethod
+    def store_user_profile_photo(image_save_dir, upload, photo_flag):
+        """
+        Moves a received upload into image_save_dir, or deletes the folder when photo_flag asks for it without
+        an upload. Runs once the write is committed, so a rolled back write leaves the photos as they were.
+        Returns whether an upload was moved into place.
+        """
+        if upload is not None:
+            temp_path, personal_photo_name = upload
+            if not temp_path:
+                return False
+            try:
+                os.makedirs(image_save_dir, exist_ok=True)
+                os.replace(temp_path, os.path.join(image_save_dir, personal_photo_name))
+                return True
+            except OSError:
+                # the write is committed already; like a failed copy, this only costs the photo
+                return False
+        if photo_flag and os.path.exists(image_save_dir):
+            try:
+                with photo_io_seconds.time(operation='delete'):
+                    shutil.rmtree(image_save_dir)
+            except OSError:
+                pass
+        return False
 
-                # example of how you can save the file
-                with open(f"{filepath}", "wb") as f:
-                    f.write(user_photo['contents'])
-                    return personal_photo_name
-            except:
-                return ''
+    @staticmethod
+    def discard_user_profile_photo(upload):
+        # a received upload that is not going to be stored
+        if upload is not None and upload[0] and os.path.exists(upload[0]):
+            os.remove(upload[0])
 
     def save_biography(self, user_bio, user_photo, event_id, photo_flag):
-        conn = self.get_db()
-
-        user_email = user_bio['Email'].lower()
-
-        already_exists_event = sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id})
-        if not already_exists_event:
-            return form_response(data={}, error_msg="invalid event ID")
-
-        already_exists_user = sqlite_select(conn,
-                                            table='biography_pending',
-                                            cols=['BiographyID', 'PersonalPhotoName'],
-                                            conds={'Email': f'{user_email}'})
-        if already_exists_user:
-            biography_id = already_exists_user[0].get('BiographyID')
-            personal_photo_name = already_exists_user[0].get('PersonalPhotoName')
-
-        else:
-            biography_id = generate_id(user_bio['Email'].lower())
-            personal_photo_name = ''
-
-        photo_folder_path = os.path.join(bio_save_path, biography_id, 'profile_photo')
-        os.makedirs(photo_folder_path, exist_ok=True)
-        personal_photo_name = self.save_user_profile_photo(photo_folder_path,
-                                                           user_photo,
-                                                           photo_flag,
-                                                           personal_photo_name)
-
-        affected_rows_b = sqlite_insert(conn=conn, table='biography_pending', replace_existing=True, rows={
-            "FirstName": user_bio.get('FirstName'),
-            "LastName": user_bio.get('LastName'),
-            "Title": user_bio.get('Title'),
-            "JobTitle": user_bio.get('JobTitle'),
-            "Email": user_bio.get('Email', '').lower(),
-            "Country": user_bio.get('Country'),
-            "LinkedInPage": user_bio.get('LinkedInPage'),
-            "TwitterPage": user_bio.get('TwitterPage'),
-            "FacebookPage": user_bio.get('FacebookPage'),
-            "SocialNetworkPage": user_bio.get('SocialNetworkPage'),
-            "BiographyID": biography_id,
-            "PersonalPhotoName": personal_photo_name,
-            "IEEEPage": user_bio.get('IEEEPage'),
-            "PersonalWebPage": user_bio.get('PersonalWebPage'),
-            "Organization": user_bio.get('Organization'),
-            "Region": user_bio.get('Region'),
-            "GoogleScholarProfile": user_bio.get('GoogleScholarProfile'),
-            "Gender": user_bio.get('Gender'),
-            "Keywords": list2str(user_bio.get('Keywords')),
-            "Biography": user_bio.get('Biography'),
-        })
-        already_exists_inv = sqlite_select(conn=conn, table='event_biography', cols=['BiographyID'], conds={
-            "BiographyID": biography_id,
-            "EventID": event_id
-        })
-        if not already_exists_inv:
-            sqlite_insert(conn=conn, table='event_biography', replace_existing=True, rows={
+        try:
+            upload = self.receive_user_profile_photo(user_photo)
+        except PhotoUploadError as ex:
+            return form_response(data={}, error_msg=str(ex))
+        try:
+            response, biography_id, personal_photo_name = self._save_biography(user_bio, upload, event_id,
+                                                                               photo_flag)
+            if biography_id is not None:
+                photo_folder_path = os.path.join(bio_save_path, biography_id, 'profile_photo')
+                if self.store_user_profile_photo(photo_folder_path, upload, photo_flag):
+                    upload = None
+                    self.photo_pipeline.submit(biography_id, photo_folder_path, personal_photo_name)
+            return response
+        finally:
+            self.discard_user_profile_photo(upload)
+
+    def _save_biography(self, user_bio, upload, event_id, photo_flag):
+        # returns the response, and the BiographyID and photo name when the bio was written
+        with self.get_db() as conn, transaction(conn):
+
+            user_email = user_bio['Email'].lower()
+
+            already_exists_event = sqlite_select(conn=conn, table='events', cols=['EventID'],
+                                                 conds={'EventID': event_id})
+            if not already_exists_event:
+                return form_response(data={}, error_msg="invalid event ID"), None, None
+
+            already_exists_user = sqlite_select(conn,
+                                                table='biography_pending',
+                                                cols=['BiographyID', 'PersonalPhotoName', 'PhotoHash'],
+                                                conds={'Email': f'{user_email}'})
+            if already_exists_user:
+                biography_id = already_exists_user[0].get('BiographyID')
+                personal_photo_name = already_exists_user[0].get('PersonalPhotoName')
+                photo_hash = already_exists_user[0].get('PhotoHash')
+
+            else:
+                biography_id = generate_id(user_bio['Email'].lower())
+                personal_photo_name = ''
+                photo_hash = ''
+
+            personal_photo_name = self.get_profile_photo_name(upload, photo_flag, personal_photo_name)
+            if upload is not None or photo_flag:
+                # a new or removed photo has no variants (yet)
+                photo_hash = ''
+
+            affected_rows_b = sqlite_insert(conn=conn, table='biography_pending', replace_existing=True, rows={
+                "FirstName": user_bio.get('FirstName'),
+                "LastName": user_bio.get('LastName'),
+                "Title": user_bio.get('Title'),
+                "JobTitle": user_bio.get('JobTitle'),
+                "Email": user_bio.get('Email', '').lower(),
+                "Country": user_bio.get('Country'),
+                "LinkedInPage": user_bio.get('LinkedInPage'),
+                "TwitterPage": user_bio.get('TwitterPage'),
+                "FacebookPage": user_bio.get('FacebookPage'),
+                "SocialNetworkPage": user_bio.get('SocialNetworkPage'),
+                "BiographyID": biography_id,
+                "PersonalPhotoName": personal_photo_name,
+                "IEEEPage": user_bio.get('IEEEPage'),
+                "PersonalWebPage": user_bio.get('PersonalWebPage'),
+                "Organization": user_bio.get('Organization'),
+                "Region": user_bio.get('Region'),
+                "GoogleScholarProfile": user_bio.get('GoogleScholarProfile'),
+                "Gender": user_bio.get('Gender'),
+                "Keywords": list2str(user_bio.get('Keywords')),
+                "Biography": user_bio.get('Biography'),
+                "PhotoHash": photo_hash,
+            })
+            sqlite_insert(conn=conn, table='event_biography', ignore_existing=True, rows={
                 "BiographyID": biography_id,
                 "EventID": event_id
             })
+            stale_keys = [('bio_email', user_email),
+                          *self.roster_cache_keys(self.get_bio_event_ids(conn, biography_id), statuses=['pending'])]
+        self.invalidate(*stale_keys)
         if affected_rows_b:
-            return form_response(data={}, success_msg='success; inserted')
-        return form_response(data={}, success_msg='success; not inserted')
+            return form_response(data={}, success_msg='success; inserted'), biography_id, personal_photo_name
+        return form_response(data={}, success_msg='success; not inserted'), biography_id, personal_photo_name
 
     def get_event(self):
-        conn = self.get_db()
-        events = sqlite_select(conn=conn, table='events', conds=dict(), cols=['EventName', 'EventID'],
-                               sort_by='CreateDate')
-        return form_response(data=events, success_msg='success')
+        return self.cached(('events',), self._get_event)
+
+    def _get_event(self):
+        with self.get_db() as conn:
+            events = sqlite_select(conn=conn, table='events', conds=dict(), cols=['EventName', 'EventID'],
+                                   sort_by='CreateDate')
+            return form_response(data=events, success_msg='success')
+
+    @staticmethod
+    def get_events_overview_sql(after_cursor=False):
+        """
+        A page of events, newest first, with the pending and validated bios linked to each counted in one
+        grouped join: the bio lookups stay in the primary key indexes, so no bio row is read. LastActivity
+        is the RosterUpdate stamped by every write to the event's links or bios.
+        """
+        where = 'WHERE (CreateDate, EventID) < (:CreateDate, :EventID)' if after_cursor else ''
+        return f"""
+        SELECT page.EventID, page.EventName, page.CreateDate, coalesce(page.RosterUpdate, page.CreateDate),
+               count(biography_pending.BiographyID), count(biography_validated.BiographyID)
+         FROM (SELECT EventID, EventName, CreateDate, RosterUpdate FROM events {where}
+               ORDER BY CreateDate DESC, EventID DESC LIMIT :limit) AS page
+         LEFT JOIN event_biography ON event_biography.EventID=page.EventID
+         LEFT JOIN biography_pending ON biography_pending.BiographyID=event_biography.BiographyID
+         LEFT JOIN biography_validated ON biography_validated.BiographyID=event_biography.BiographyID
+        GROUP BY page.CreateDate, page.EventID
+        ORDER BY page.CreateDate DESC, page.EventID DESC
+        """
+
+    def get_events_overview(self, limit=events_page_size, cursor=None):
+        """
+        One page of the events dashboard: each event with its PendingCount, ValidatedCount and LastActivity,
+        newest first. Pass the returned next_cursor to get the following page; it is None on the last page.
+        """
+        limit = max(1, min(int(limit), events_page_max_size))
+        params = {'limit': limit + 1}
+        if cursor:
+            values = decode_cursor(cursor)
+            if values is None or len(values) != len(events_key_cols):
+                return form_response(data={}, error_msg='invalid cursor.')
+            params.update(zip(events_key_cols, values))
+
+        sql = self.get_events_overview_sql(after_cursor=bool(cursor))
+        with self.get_db() as conn:
+            with timed_query(conn, 'events_overview', 'event_biography', sql, params):
+                rows = conn.cursor().execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_event = dict(zip(events_overview_cols, rows[-1]))
+            next_cursor = encode_cursor([last_event[col] for col in events_key_cols])
+
+        events = get_list_of_dict(keys=events_overview_cols, list_of_tuples=rows)
+        return form_response(data={'events': events, 'next_cursor': next_cursor}, success_msg='success')
 
     def retrieve_bios_by_event(self, event_id, biography_status):
+        return self.retrieve_bios_by_event_if_modified(event_id, biography_status)[0]
 
-        conn = self.get_db()
+    def retrieve_bios_by_event_if_modified(self, event_id, biography_status, is_current=None):
+        """
+        (response, version) of retrieve_bios_by_event, version being the form_version of the event's roster;
+        (None, version) when is_current(version) holds, as in retrieve_bio_by_id_if_modified.
+        """
+        if is_current is not None and biography_status in ['pending', 'validated']:
+            with self.get_db() as conn:
+                version = self.get_roster_version(conn, event_id)
+            if version and is_current(version):
+                return None, version
+        return self.cached_with_version(('event_bios', event_id.lower(), biography_status),
+                                        lambda: self._retrieve_bios_by_event(event_id, biography_status),
+                                        lambda conn: self.get_roster_version(conn, event_id))
 
+    @staticmethod
+    def get_roster_version(conn, event_id):
+        # one version per event covers both statuses: any write to one of its bios or links bumps it
+        rows = sqlite_select(conn=conn, table='events', cols=['RosterVersion', 'RosterUpdate'],
+                             conds={'EventID': event_id})
+        return form_version(rows[0]['RosterVersion'], rows[0]['RosterUpdate']) if rows else None
+
+    def _retrieve_bios_by_event(self, event_id, biography_status):
+
+        with self.get_db() as conn:
+
+            if biography_status not in ['pending', 'validated']:
+                return form_response(data={},
+                                     error_msg='Invalid biography status. It must be either '
+                                               '"pending" or "validated."'), None
+
+            # read before the roster, so the version can only be older than the rows, never newer
+            version = self.get_roster_version(conn, event_id)
+            if not version:
+                return form_response(data={}, error_msg="invalid event ID."), None
+
+            sql = f"""
+            SELECT {', '.join([f'biography_{biography_status}.' + x for x in biography_cols])}
+             FROM event_biography CROSS JOIN biography_{biography_status}
+            WHERE biography_{biography_status}.BiographyID=event_biography.BiographyID
+            AND event_biography.EventID=:EventID
+            ORDER BY biography_{biography_status}.LastName, biography_{biography_status}.FirstName
+            """
+
+            project = get_row_projector(tuple(biography_cols), tuple(roster_fields))
+            with timed_query(conn, 'roster', f'biography_{biography_status}', sql, {'EventID': event_id}):
+                result = conn.cursor().execute(sql, {'EventID': event_id})
+                biographies = [project(row) for row in result]
+            return form_response(data=biographies, success_msg='success'), version
+
+    @staticmethod
+    def check_roster_request(conn, event_id, biography_status, fields):
+        if biography_status not in ['pending', 'validated']:
+            return 'Invalid biography status. It must be either "pending" or "validated."'
+        unknown_fields = [field for field in fields or [] if field not in roster_fields]
+        if unknown_fields:
+            return f'Unknown fields: {", ".join(unknown_fields)}'
+        if not sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id}):
+            return 'invalid event ID.'
+        return ''
+
+    @staticmethod
+    def get_roster_sql(biography_status, fields, after_cursor=False, limit=False):
+        """
+        Roster query in keyset order (LastName, FirstName, BiographyID). The key columns and BiographyID
+        (needed for photo and profile URLs) are always selected; PhotoVariants is derived from PhotoHash.
+        """
+        table = f'biography_{biography_status}'
+        cols = [col for col in biography_cols if col in roster_key_cols or col in fields or
+                (col == 'PhotoHash' and 'PhotoVariants' in fields)]
+        sql = f"""
+        SELECT {', '.join(f'{table}.{col}' for col in cols)}
+         FROM event_biography CROSS JOIN {table}
+        WHERE {table}.BiographyID=event_biography.BiographyID
+        AND event_biography.EventID=:EventID
+        """
+        if after_cursor:
+            sql += f' AND ({table}.LastName, {table}.FirstName, {table}.BiographyID) > ' \
+                   f'(:LastName, :FirstName, :BiographyID)'
+        sql += f' ORDER BY {table}.LastName, {table}.FirstName, {table}.BiographyID'
+        if limit:
+            sql += ' LIMIT :limit'
+        return sql, cols
+
+    def retrieve_bios_by_event_page(self, event_id, biography_status, limit=roster_page_size, cursor=None,
+                                    fields=None):
+        """
+        One page of an event roster. Pass the returned next_cursor to get the following page; it is None
+        on the last page. fields restricts the returned keys, e.g. to skip the Biography text in list views.
+        """
+        fields = fields or roster_fields
+        limit = max(1, min(int(limit), roster_page_max_size))
+
+        with self.get_db() as conn:
+            error_msg = self.check_roster_request(conn, event_id, biography_status, fields)
+            if error_msg:
+                return form_response(data={}, error_msg=error_msg)
+
+            after = None
+            if cursor:
+                after = decode_cursor(cursor)
+                if after is None or len(after) != len(roster_key_cols):
+                    return form_response(data={}, error_msg='invalid cursor.')
+
+            biographies, next_key = self.read_roster_page(conn, event_id, biography_status, fields, limit, after)
+        next_cursor = encode_cursor(next_key) if next_key else None
+        return form_response(data={'biographies': biographies, 'next_cursor': next_cursor}, success_msg='success')
+
+    def read_roster_page(self, conn, event_id, biography_status, fields, limit, after=None):
+        """
+        Up to limit roster rows projected to fields, following the roster_key_cols values `after` (None for
+        the first page), and the key values of the last row when more rows follow it, else None.
+        """
+        params = {'EventID': event_id, 'limit': limit + 1}
+        if after:
+            params.update(zip(roster_key_cols, after))
+        sql, cols = self.get_roster_sql(biography_status, fields, after_cursor=bool(after), limit=True)
+        with timed_query(conn, 'roster_page', f'biography_{biography_status}', sql, params):
+            rows = conn.cursor().execute(sql, params).fetchall()
+
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_row = dict(zip(cols, rows[-1]))
+            next_key = [last_row[col] for col in roster_key_cols]
+        project = get_row_projector(tuple(cols), tuple(fields))
+        return [project(row) for row in rows], next_key
+
+    def read_roster_batch(self, event_id, biography_status, fields=None, batch_size=200, after=None):
+        # one batch of a roster stream, on a connection of its own: none is held between batches
+        with self.get_db() as conn:
+            return self.read_roster_page(conn, event_id, biography_status, fields or roster_fields, batch_size,
+                                         after)
+
+    def check_roster_stream(self, event_id, biography_status, fields=None):
+        with self.get_db() as conn:
+            error_msg = self.check_roster_request(conn, event_id, biography_status, fields)
+        if error_msg:
+            return form_response(data={}, error_msg=error_msg)
+        return None
+
+    def iter_bios_by_event(self, event_id, biography_status, fields=None, batch_size=200):
+        """
+        Generator over a whole roster in keyset order, read batch_size rows at a time through the roster pages
+        instead of materializing the list. Validate the request with check_roster_stream first.
+        """
+        after = None
+        while True:
+            biographies, after = self.read_roster_batch(event_id, biography_status, fields=fields,
+                                                        batch_size=batch_size, after=after)
+            yield from biographies
+            if after is None:
+                break
+
+    @staticmethod
+    def resolve_bio_emails(conn, bio_emails):
+        """
+        {email: (validated BiographyID, pending BiographyID)} for a list of emails, from one query against
+        both biography tables; either ID is None when the email has no bio of that status.
+        """
+        emails = list(dict.fromkeys(email.lower() for email in bio_emails))
+        result = conn.cursor().execute("""
+        SELECT json_each.value, biography_validated.BiographyID, biography_pending.BiographyID
+         FROM json_each(:emails)
+         LEFT JOIN biography_validated ON biography_validated.Email=json_each.value
+         LEFT JOIN biography_pending ON biography_pending.Email=json_each.value
+        """, {'emails': json.dumps(emails)})
+        return {email: (validated_id, pending_id) for email, validated_id, pending_id in result}
+
+    def append_bios_to_event(self, event_id, bio_emails):
+        """
+        Bulk append_bio_to_event: links every validated bio among bio_emails to the event with one statement
+        and returns the per-email status of append_bio_to_event.
+        """
+        with self.get_db() as conn, transaction(conn):
+            if not sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id}):
+                return form_response(data={}, error_msg="invalid event ID")
+
+            bios = self.resolve_bio_emails(conn, bio_emails)
+            validated_ids = [validated_id for validated_id, _ in bios.values() if validated_id]
+            conn.execute('INSERT OR IGNORE INTO event_biography (EventID, BiographyID) '
+                         'SELECT :EventID, value FROM json_each(:ids)',
+                         {'EventID': event_id, 'ids': json.dumps(validated_ids)})
+        if validated_ids:
+            self.invalidate(*self.roster_cache_keys([event_id], statuses=['validated']))
+
+        items = []
+        for email, (validated_id, pending_id) in bios.items():
+            if validated_id:
+                items.append({'Email': email, 'status': "1", "message": "Added"})
+            elif pending_id:
+                items.append({'Email': email, 'status': "0", "message": "Pending"})
+            else:
+                items.append({'Email': email, 'status': "-1", "message": "unavailable"})
+        return form_response(data={'items': items}, success_msg="success")
+
+    def remove_bios_from_event(self, event_id, bio_emails):
+        """
+        Bulk remove_bio_from_event: unlinks every validated bio among bio_emails from the event with one
+        statement; an email without a validated bio is reported as "not found".
+        """
+        with self.get_db() as conn, transaction(conn):
+            if not sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id}):
+                return form_response(data={}, error_msg="invalid event ID")
+
+            bios = self.resolve_bio_emails(conn, bio_emails)
+            validated_ids = [validated_id for validated_id, _ in bios.values() if validated_id]
+            conn.execute('DELETE FROM event_biography '
+                         'WHERE EventID=:EventID AND BiographyID IN (SELECT value FROM json_each(:ids))',
+                         {'EventID': event_id, 'ids': json.dumps(validated_ids)})
+        if validated_ids:
+            self.invalidate(*self.roster_cache_keys([event_id], statuses=['validated']))
+
+        items = [{'Email': email, 'status': 'removed' if validated_id else 'not found'}
+                 for email, (validated_id, _) in bios.items()]
+        return form_response(data={'items': items}, success_msg="success")
+
+    def retrieve_bios_by_keyword(self, keyword, biography_status='validated', event_id=None,
+                                 limit=roster_page_size, cursor=None, fields=None):
+        """
+        Speakers tagged with an itu_keywords keyword (any case), optionally only those of one event, read
+        from the biography_keyword index in the keyset order and page shape of retrieve_bios_by_event_page.
+        """
+        fields = fields or roster_fields
         if biography_status not in ['pending', 'validated']:
             return form_response(data={},
                                  error_msg='Invalid biography status. It must be either "pending" or "validated."')
+        unknown_fields = [field for field in fields if field not in roster_fields]
+        if unknown_fields:
+            return form_response(data={}, error_msg=f'Unknown fields: {", ".join(unknown_fields)}')
+        limit = max(1, min(int(limit), roster_page_max_size))
 
-        already_exists_event = sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id})
-        if not already_exists_event:
-            return form_response(data={}, error_msg="invalid event ID.")
+        table = f'biography_{biography_status}'
+        params = {'Status': biography_status, 'EventID': event_id, 'limit': limit + 1}
+        if cursor:
+            values = decode_cursor(cursor)
+            if values is None or len(values) != len(roster_key_cols):
+                return form_response(data={}, error_msg='invalid cursor.')
+            params.update(zip(roster_key_cols, values))
 
+        cols = [col for col in biography_cols if col in roster_key_cols or col in fields or
+                (col == 'PhotoHash' and 'PhotoVariants' in fields)]
         sql = f"""
-        SELECT {', '.join([f'biography_{biography_status}.' + x for x in biography_cols])}
-         FROM biography_{biography_status} JOIN  event_biography
-        WHERE LOWER(biography_{biography_status}.BiographyID)=LOWER(event_biography.BiographyID) 
-        AND LOWER(event_biography.EventID)=LOWER(:EventID)
-        ORDER BY biography_{biography_status}.LastName, biography_{biography_status}.FirstName
-        """
-
-        result = conn.cursor().execute(sql, {'EventID': event_id})
-        biographies = get_list_of_dict(keys=biography_cols, list_of_tuples=result)
-        for biography in biographies:
-            biography['PersonalPhotoName'] = self.get_photo_path(biography_id=biography.get('BiographyID'),
-                                                                 photo_name=biography.get('PersonalPhotoName'))
-            biography['Keywords'] = str2list(biography['Keywords'])
-            biography['ProfileULR'] = os.path.join(profile_url_base, biography.get('BiographyID'))
-        return form_response(data=biographies, success_msg='success')
+        SELECT {', '.join(f'{table}.{col}' for col in cols)}
+         FROM biography_keyword CROSS JOIN {table}
+        WHERE biography_keyword.KwID=:KwID AND biography_keyword.Status=:Status
+        AND {table}.BiographyID=biography_keyword.BiographyID
+        """
+        if event_id:
+            sql += f' AND EXISTS (SELECT 1 FROM event_biography WHERE EventID=:EventID ' \
+                   f'AND BiographyID={table}.BiographyID)'
+        if cursor:
+            sql += f' AND ({table}.LastName, {table}.FirstName, {table}.BiographyID) > ' \
+                   f'(:LastName, :FirstName, :BiographyID)'
+        sql += f' ORDER BY {table}.LastName, {table}.FirstName, {table}.BiographyID LIMIT :limit'
 
-    def get_itu_keywords(self, query, top_x=10):
+        with self.get_db() as conn:
+            if event_id and not sqlite_select(conn=conn, table='events', cols=['EventID'],
+                                              conds={'EventID': event_id}):
+                return form_response(data={}, error_msg="invalid event ID.")
+            params['KwID'] = self.get_keyword_id(conn, keyword)
+            if params['KwID'] is None:
+                return form_response(data={}, error_msg='unknown keyword.')
+            with timed_query(conn, 'bios_by_keyword', table, sql, params):
+                rows = conn.cursor().execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_row = dict(zip(cols, rows[-1]))
+            next_cursor = encode_cursor([last_row[col] for col in roster_key_cols])
+
+        project = get_row_projector(tuple(cols), tuple(fields))
+        biographies = [project(row) for row in rows]
+        return form_response(data={'biographies': biographies, 'next_cursor': next_cursor}, success_msg='success')
 
+    @staticmethod
+    def get_keyword_id(conn, keyword):
+        # keywords differing only in case share their lowest KwID (see migration 6)
+        return conn.cursor().execute('SELECT min(KwID) FROM itu_keywords WHERE KwText=? COLLATE NOCASE',
+                                     (keyword.strip(),)).fetchone()[0]
+
+    def get_keyword_facets(self, event_id, biography_status='validated'):
+        """
+        [{'Keyword', 'Speakers'}] of the event's speakers with the given status, most frequent first.
+        """
+        if biography_status not in ['pending', 'validated']:
+            return form_response(data={},
+                                 error_msg='Invalid biography status. It must be either "pending" or "validated."')
+        with self.get_db() as conn:
+            if not sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id}):
+                return form_response(data={}, error_msg="invalid event ID.")
+            sql = """
+            SELECT itu_keywords.KwText, tags.Speakers
+             FROM (SELECT biography_keyword.KwID, count(*) AS Speakers
+                    FROM event_biography CROSS JOIN biography_keyword
+                   WHERE event_biography.EventID=:EventID AND biography_keyword.Status=:Status
+                   AND biography_keyword.BiographyID=event_biography.BiographyID
+                   GROUP BY biography_keyword.KwID) AS tags
+             CROSS JOIN itu_keywords
+            WHERE itu_keywords.KwID=tags.KwID
+            ORDER BY tags.Speakers DESC, itu_keywords.KwText
+            """
+            params = {'EventID': event_id, 'Status': biography_status}
+            with timed_query(conn, 'keyword_facets', 'biography_keyword', sql, params):
+                result = conn.cursor().execute(sql, params)
+                facets = get_list_of_dict(keys=['Keyword', 'Speakers'], list_of_tuples=result)
+        return form_response(data=facets, success_msg='success')
+
+    @staticmethod
+    def is_unranked_query(conn, fts, words):
+        """
+        bm25 gives a term found in more than half of the documents an IDF of ~0. When every query word is
+        such a term, the hits are most of the table and cannot be told apart by rank, so ranking them all
+        would only cost time; they are returned in rowid order instead.
+        """
+        half = conn.cursor().execute(f'SELECT count(*) FROM {fts}_docsize').fetchone()[0] / 2
+        # longer words are usually rarer, and one rare word settles it
+        for word in sorted(words[:-1], key=len, reverse=True):
+            if (conn.cursor().execute(f'SELECT max(doc) FROM {fts}_vocab WHERE term=?',
+                                      (word,)).fetchone()[0] or 0) <= half:
+                return False
+        # the last word is matched as a prefix: its most frequent completion bounds the hits from below
+        return (conn.cursor().execute(f'SELECT max(doc) FROM {fts}_vocab WHERE term>=? AND term<?',
+                                      (words[-1], words[-1] + '\U0010ffff')).fetchone()[0] or 0) > half
+
+    def search_bios(self, query, biography_status='validated', event_id=None, filters=None, limit=search_page_size,
+                    cursor=None):
+        """
+        Full-text speaker search over names, JobTitle, Organization, Keywords and Biography, ranked by bm25
+        with a Snippet of the best matching column. filters is an optional {Country|Region|Gender: value};
+        event_id restricts the hits to an event's roster. Pass the returned next_cursor for the next page.
+        """
+        if biography_status not in ['pending', 'validated']:
+            return form_response(data={},
+                                 error_msg='Invalid biography status. It must be either "pending" or "validated."')
+        filters = {col: value for col, value in (filters or dict()).items() if value}
+        unknown_filters = [col for col in filters if col not in search_filter_cols]
+        if unknown_filters:
+            return form_response(data={}, error_msg=f'Unknown filters: {", ".join(unknown_filters)}')
+        words = get_search_words(query or '')
+        if not words:
+            return form_response(data={}, error_msg='the search query has no words.')
+        offset = 0
+        if cursor:
+            values = decode_cursor(cursor)
+            if not values or not isinstance(values[0], int) or values[0] < 0:
+                return form_response(data={}, error_msg='invalid cursor.')
+            offset = values[0]
+        limit = max(1, min(int(limit), search_page_max_size))
+
+        table = f'biography_{biography_status}'
+        fts = f'{table}_fts'
         sql = f"""
-                SELECT KwText FROM itu_keywords
-                WHERE lower(KwText) like ? LIMIT ? 
-                """
-        conn = self.get_db()
-        cur = conn.cursor()
-        cur.execute(sql, ("%" + query.lower() + "%", top_x))
-        result = cur.fetchall()
-        result = [x[0] for x in result]
-        return result
+        SELECT {', '.join(f'{table}.{col}' for col in search_result_cols)},
+               snippet({fts}, -1, '<b>', '</b>', '…', 16)
+         FROM {fts} CROSS JOIN {table}
+        WHERE {table}.rowid={fts}.rowid
+        AND {fts} MATCH :query
+        """
+        sql += ''.join(f' AND {table}.{col}=:{col}' for col in filters)
+        if event_id:
+            sql += f' AND EXISTS (SELECT 1 FROM event_biography WHERE EventID=:EventID ' \
+                   f'AND BiographyID={table}.BiographyID)'
+
+        with self.get_db() as conn:
+            if event_id and not sqlite_select(conn=conn, table='events', cols=['EventID'],
+                                              conds={'EventID': event_id}):
+                return form_response(data={}, error_msg="invalid event ID.")
+            sql += f' ORDER BY {fts}.rowid' if self.is_unranked_query(conn, fts, words) else ' ORDER BY rank'
+            sql += ' LIMIT :limit OFFSET :offset'
+            params = {'query': get_match_query(words), 'EventID': event_id, 'limit': limit + 1, 'offset': offset,
+                      **filters}
+            with timed_query(conn, 'search', fts, sql, params):
+                rows = conn.cursor().execute(sql, params).fetchall()
+
+        next_cursor = encode_cursor([offset + limit]) if len(rows) > limit else None
+        fields = [*search_result_fields, 'ProfileULR'] if biography_status == 'validated' else search_result_fields
+        project = get_row_projector((*search_result_cols, 'Snippet'), tuple(fields))
+        biographies = [project(row) for row in rows[:limit]]
+        return form_response(data={'biographies': biographies, 'next_cursor': next_cursor}, success_msg='success')
+
+    def get_itu_keywords(self, query, top_x=10):
+        if self.keyword_index.due_for_check():
+            with self.get_db() as conn:
+                self.keyword_index.refresh(conn)
+        return self.keyword_index.search(query, top_x=top_x)
+
+    @staticmethod
+    def get_import_values(row):
+        """
+        The import_cols values of one imported row, or an error message when the row is invalid.
+        """
+        if None in row:
+            return None, 'more values than columns'
+        unknown_cols = [col for col in row if col not in import_cols and col not in ignored_import_cols]
+        if unknown_cols:
+            return None, f'Unknown columns: {", ".join(unknown_cols)}'
+        missing_cols = [col for col in required_import_cols if not str(row.get(col) or '').strip()]
+        if missing_cols:
+            return None, f'Missing values: {", ".join(missing_cols)}'
+
+        values = {col: row.get(col) for col in import_cols}
+        if isinstance(values['Keywords'], list) and all(isinstance(keyword, str) for keyword in values['Keywords']):
+            values['Keywords'] = list2str(values['Keywords'])
+        bad_cols = [col for col, value in values.items() if value is not None and not isinstance(value, str)]
+        if bad_cols:
+            return None, f'Values must be text: {", ".join(bad_cols)}'
+        values['Email'] = values['Email'].strip().lower()
+        if '@' not in values['Email']:
+            return None, 'invalid email'
+        values['BiographyID'] = generate_id(values['Email'])
+        return values, ''
+
+    @staticmethod
+    def import_batch(conn, table, event_id, batch):
+        # an email that is already known keeps its BiographyID, photo and CreateDate. Returns the batch's IDs.
+        cols = ['BiographyID', *import_cols]
+        upsert_sql = f"""
+        INSERT INTO "{table}" ({', '.join(f'"{col}"' for col in cols)})
+        VALUES ({', '.join(f':{col}' for col in cols)})
+        ON CONFLICT(Email) DO UPDATE SET {', '.join(f'"{col}"=excluded."{col}"' for col in import_cols)}
+        """
+        link_sql = f"""
+        INSERT OR IGNORE INTO event_biography (EventID, BiographyID)
+        SELECT :EventID, BiographyID FROM "{table}" WHERE Email=:Email
+        """
+        with transaction(conn):
+            conn.executemany(upsert_sql, batch)
+            conn.executemany(link_sql, ({'EventID': event_id, 'Email': values['Email']} for values in batch))
+            return [row[0] for row in conn.execute(f'SELECT BiographyID FROM "{table}" '
+                                                   f'WHERE Email IN (SELECT value FROM json_each(:emails))',
+                                                   {'emails': json.dumps([values['Email'] for values in batch])})]
+
+    def get_import_snapshot_keys(self, conn, biography_ids):
+        # the cache keys of the validated bios and rosters an import batch changed, in one query for all the bios
+        event_ids = [row[0] for row in conn.execute('SELECT DISTINCT EventID FROM event_biography '
+                                                    'WHERE BiographyID IN (SELECT value FROM json_each(:ids))',
+                                                    {'ids': json.dumps(biography_ids)})]
+        return [*[('bio_id', bio_id.lower()) for bio_id in biography_ids],
+                *self.roster_cache_keys(event_ids, statuses=['validated'])]
+
+    def import_biographies(self, source, file_format, event_id, biography_status='pending',
+                           batch_size=import_batch_size):
+        """
+        Upserts the biographies of a CSV (header row of biography_cols) or NDJSON file object, by email,
+        into biography_<biography_status> and links each of them to the event. The file is read row by row
+        and written batch_size rows per transaction; invalid rows are skipped and reported with their line.
+        """
+        if biography_status not in ['pending', 'validated']:
+            return form_response(data={},
+                                 error_msg='Invalid biography status. It must be either "pending" or "validated."')
+        if file_format not in bulk_formats:
+            return form_response(data={}, error_msg=f'Unknown format {file_format}.')
+
+        table = f'biography_{biography_status}'
+        imported = 0
+        errors = []
+        snapshot_keys = []
+        try:
+            with self.get_db() as conn:
+                if not sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id}):
+                    return form_response(data={}, error_msg="invalid event ID.")
+
+                batch = []
+                for line, row, error_msg in iter_import_rows(source, file_format):
+                    values = None
+                    if not error_msg:
+                        values, error_msg = self.get_import_values(row)
+                    if error_msg:
+                        errors.append({'line': line, 'error': error_msg})
+                        continue
+                    batch.append(values)
+                    if len(batch) >= batch_size:
+                        biography_ids = self.import_batch(conn, table, event_id, batch)
+                        imported += len(batch)
+                        batch = []
+                        if biography_status == 'validated':
+                            snapshot_keys += self.get_import_snapshot_keys(conn, biography_ids)
+                if batch:
+                    biography_ids = self.import_batch(conn, table, event_id, batch)
+                    imported += len(batch)
+                    if biography_status == 'validated':
+                        snapshot_keys += self.get_import_snapshot_keys(conn, biography_ids)
+        finally:
+            # a bulk import touches arbitrary bios and rosters; dropping the cache is cheaper than tracking them
+            if imported:
+                self.cache.clear()
+            self.mark_snapshots(snapshot_keys)
+
+        return form_response(data={'imported': imported, 'errors': errors},
+                             success_msg='success' if not errors else f'success; {len(errors)} rows skipped')
+
+    @staticmethod
+    def get_export_query(table=None, event_id=None, biography_status=None, after_key=False):
+        """
+        The query of one export batch in keyset order, and its key columns, which are selected first and are
+        not exported: the rowid of a table (the primary key of event_biography, which has none), and the
+        BiographyID of a roster.
+        """
+        if table is not None:
+            key_cols = ['EventID', 'BiographyID'] if table == 'event_biography' else ['rowid']
+            keys = ', '.join(key_cols)
+            after = f'({keys}) > ({", ".join(f":{col}" for col in key_cols)})' if after_key else '1=1'
+            return f'SELECT {keys}, * FROM "{table}" WHERE {after} ORDER BY {keys} LIMIT :limit', key_cols
+        table = f'biography_{biography_status}'
+        after = 'AND event_biography.BiographyID > :BiographyID' if after_key else ''
+        return f"""
+        SELECT event_biography.BiographyID, {table}.*
+         FROM event_biography CROSS JOIN {table}
+        WHERE {table}.BiographyID=event_biography.BiographyID
+        AND event_biography.EventID=:EventID {after}
+        ORDER BY event_biography.BiographyID LIMIT :limit
+        """, ['BiographyID']
+
+    def check_export(self, table=None, event_id=None, biography_status=None, file_format='csv'):
+        if file_format not in bulk_formats:
+            return form_response(data={}, error_msg=f'Unknown format {file_format}.')
+        if table is not None:
+            if table not in export_tables:
+                return form_response(data={}, error_msg=f'Unknown table {table}.')
+            return None
+        with self.get_db() as conn:
+            error_msg = self.check_roster_request(conn, event_id, biography_status, fields=None)
+        if error_msg:
+            return form_response(data={}, error_msg=error_msg)
+        return None
+
+    def read_export_batch(self, table=None, event_id=None, biography_status=None, file_format='csv', batch_size=200,
+                          after=None):
+        """
+        The encoded lines of up to batch_size exported rows following the key values `after` (None for the
+        first batch, which starts with the CSV header), and the key values of the last row when more follow.
+        """
+        sql, key_cols = self.get_export_query(table=table, event_id=event_id, biography_status=biography_status,
+                                              after_key=after is not None)
+        params = {'EventID': event_id, 'limit': batch_size + 1, **dict(zip(key_cols, after or []))}
+        with self.get_db() as conn:
+            result = conn.cursor().execute(sql, params)
+            cols = [description[0] for description in result.description][len(key_cols):]
+            rows = result.fetchall()
+
+        next_key = None
+        if len(rows) > batch_size:
+            rows = rows[:batch_size]
+            next_key = list(rows[-1][:len(key_cols)])
+        lines = list(iter_export_lines(cols, [row[len(key_cols):] for row in rows], file_format))
+        if after is not None and file_format == 'csv':
+            lines = lines[1:]
+        return lines, next_key
+
+    def iter_export(self, table=None, event_id=None, biography_status=None, file_format='csv', batch_size=200):
+        """
+        Generator over the encoded lines of a whole table, or of an event roster with the raw biography
+        columns, so an export can be imported again. Rows are read batch_size at a time in keyset order and
+        never collected. Validate the request with check_export first.
+        """
+        after = None
+        while True:
+            lines, after = self.read_export_batch(table=table, event_id=event_id, biography_status=biography_status,
+                                                  file_format=file_format, batch_size=batch_size, after=after)
+            yield from lines
+            if after is None:
+                break
 
     def remove_bio_from_event(self, event_id, bio_email):
-        conn = self.get_db()
-        already_exists_event = sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id})
-        if not already_exists_event:
-            return form_response(data={}, error_msg="invalid event ID")
-
-        bio_email = bio_email.lower()
-        already_exists_user_v = sqlite_select(conn,
-                                              table='biography_validated',
-                                              cols=['BiographyID'],
-                                              conds={'Email': f'{bio_email}'})
-        if already_exists_user_v:
-            biography_id = already_exists_user_v[0].get('BiographyID')
-            sqlite_delete(conn=conn, table='event_biography', conds={'EventID': f'{event_id}',
-                                                                     'BiographyID': f'{biography_id}',
-                                                                     })
-            return form_response(data={}, success_msg="success; removed")
-        return form_response(data={}, success_msg="success; not found")
+        with self.get_db() as conn, transaction(conn):
+            already_exists_event = sqlite_select(conn=conn, table='events', cols=['EventID'],
+                                                 conds={'EventID': event_id})
+            if not already_exists_event:
+                return form_response(data={}, error_msg="invalid event ID")
+
+            bio_email = bio_email.lower()
+            already_exists_user_v = sqlite_select(conn,
+                                                  table='biography_validated',
+                                                  cols=['BiographyID'],
+                                                  conds={'Email': f'{bio_email}'})
+            if already_exists_user_v:
+                biography_id = already_exists_user_v[0].get('BiographyID')
+                sqlite_delete(conn=conn, table='event_biography', conds={'EventID': f'{event_id}',
+                                                                         'BiographyID': f'{biography_id}',
+                                                                         })
+            else:
+                return form_response(data={}, success_msg="success; not found")
+        self.invalidate(*self.roster_cache_keys([event_id], statuses=['validated']))
+        return form_response(data={}, success_msg="success; removed")
 
     def append_bio_to_event(self, event_id, bio_email):
-        conn = self.get_db()
-        already_exists_event = sqlite_select(conn=conn, table='events', cols=['EventID'], conds={'EventID': event_id})
-        if not already_exists_event:
-            return form_response(data={}, error_msg="invalid event ID")
-
-        bio_email = bio_email.lower()
-        already_exists_user_v = sqlite_select(conn,
-                                              table='biography_validated',
-                                              cols=['BiographyID'],
-                                              conds={'Email': f'{bio_email}'})
-        already_exists_user_p = sqlite_select(conn,
-                                              table='biography_pending',
-                                              cols=['BiographyID'],
-                                              conds={'Email': f'{bio_email}'})
-        if already_exists_user_v:
-            biography_id = already_exists_user_v[0].get('BiographyID')
-            # check if relation already exists:
-            exists_relation = sqlite_select(conn=conn, table='event_biography', cols=['EventID', 'BiographyID'],
-                                            conds={'EventID': f'{event_id}',
-                                                   'BiographyID': f'{biography_id}',
-                                                   })
-            if not exists_relation:
+        with self.get_db() as conn, transaction(conn):
+            already_exists_event = sqlite_select(conn=conn, table='events', cols=['EventID'],
+                                                 conds={'EventID': event_id})
+            if not already_exists_event:
+                return form_response(data={}, error_msg="invalid event ID")
+
+            bio_email = bio_email.lower()
+            already_exists_user_v = sqlite_select(conn,
+                                                  table='biography_validated',
+                                                  cols=['BiographyID'],
+                                                  conds={'Email': f'{bio_email}'})
+            already_exists_user_p = sqlite_select(conn,
+                                                  table='biography_pending',
+                                                  cols=['BiographyID'],
+                                                  conds={'Email': f'{bio_email}'})
+            if already_exists_user_v:
+                biography_id = already_exists_user_v[0].get('BiographyID')
                 sqlite_insert(conn=conn, table='event_biography', rows={
                     'EventID': event_id,
                     'BiographyID': biography_id
-                }, replace_existing=True)
-            return form_response(data={'status': "1", "message": "Added"}, success_msg="success")
-
-        elif already_exists_user_p:
-            return form_response(data={'status': "0", "message": "Pending"}, success_msg="success")
-        else:
-            return form_response(data={'status': "-1", "message": "unavailable"}, success_msg="success")
+                }, ignore_existing=True)
+            elif already_exists_user_p:
+                return form_response(data={'status': "0", "message": "Pending"}, success_msg="success")
+            else:
+                return form_response(data={'status': "-1", "message": "unavailable"}, success_msg="success")
+        self.invalidate(*self.roster_cache_keys([event_id], statuses=['validated']))
+        return form_response(data={'status': "1", "message": "Added"}, success_msg="success")
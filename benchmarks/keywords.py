@@ -0,0 +1,95 @@
+"""
+Compare the in-memory keyword index against the LIKE query it replaced.
+
+    python -m benchmarks.keywords [database_path] [queries]
+"""
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from keyword_index import KeywordIndex
+from migrations import apply_migrations
+
+like_sql = """
+        SELECT KwText FROM itu_keywords
+        WHERE lower(KwText) like ? LIMIT ?
+        """
+
+
+def sample_queries(conn, count, seed=0):
+    """
+    Autocomplete-shaped queries: growing prefixes and infixes of real keywords plus a few typos.
+    """
+    rng = random.Random(seed)
+    keywords = [row[0].lower() for row in conn.cursor().execute('SELECT KwText FROM itu_keywords')]
+    queries = []
+    while len(queries) < count:
+        keyword = rng.choice(keywords)
+        start = rng.choice([0, 0, rng.randrange(len(keyword))])
+        fragment = keyword[start:start + rng.randint(1, 8)]
+        if len(fragment) > 4 and rng.random() < 0.1:
+            typo = rng.randrange(len(fragment))
+            fragment = fragment[:typo] + 'x' + fragment[typo + 1:]
+        queries.append(fragment)
+    return queries
+
+
+def time_calls(func, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        func(query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return {
+        'p50_us': round(statistics.median(timings), 1),
+        'p99_us': round(timings[int(len(timings) * 0.99) - 1], 1),
+        'max_us': round(timings[-1], 1)
+    }
+
+
+def run(database_path='itu_event_biography_db.db', count=5000, top_x=10):
+    # work on a copy: apply_migrations upgrades the schema in place
+    work_dir = tempfile.mkdtemp()
+    try:
+        copy_path = os.path.join(work_dir, 'benchmark.db')
+        shutil.copyfile(database_path, copy_path)
+        conn = sqlite3.connect(copy_path)
+        apply_migrations(conn)
+        queries = sample_queries(conn, count)
+
+        def sql_path(query):
+            # the previous implementation, including its connection per call
+            sql_conn = sqlite3.connect(copy_path)
+            sql_conn.cursor().execute(like_sql, ('%' + query.lower() + '%', top_x)).fetchall()
+            sql_conn.close()
+
+        index = KeywordIndex()
+        started = time.perf_counter()
+        index.load(conn)
+        load_ms = round((time.perf_counter() - started) * 1e3, 1)
+
+        results = {
+            'queries': count,
+            'index_load_ms': load_ms,
+            'sql_like': time_calls(sql_path, queries),
+            'index': time_calls(lambda query: index.search(query, top_x=top_x), queries),
+            'index_exact_only': time_calls(lambda query: index.search(query, top_x=top_x, max_typos=0), queries)
+        }
+        conn.close()
+        return results
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    results = run(*args[:1], *[int(arg) for arg in args[1:2]])
+    for name in ['sql_like', 'index', 'index_exact_only']:
+        print(f'{name:>18}: {results[name]}')
+    print(f'{"index load":>18}: {results["index_load_ms"]} ms for {results["queries"]} queries')
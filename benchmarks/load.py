@@ -0,0 +1,426 @@
+"""
+Load driver for every route of main.py, against synthetic databases (benchmarks.synthetic) of several sizes.
+
+    python -m benchmarks.load [--mode inprocess|http] [--scales 1000,10000,100000] [--requests 200]
+                              [--concurrency 4] [--seed 0] [--data-dir DIR] [--output results.json]
+    python -m benchmarks.load compare <baseline.json> <current.json> [--threshold 0.25]
+
+inprocess drives the ASGI app through Starlette's TestClient in this process, which also measures the Python
+memory each request allocates (tracemalloc peak); http starts uvicorn on the database and drives it over
+sockets. Both need httpx, as the TestClient does. Every scale runs on a fresh copy of its generated database,
+read routes first, and photos and snapshots go to a temporary directory instead of bio_save_path and
+snapshot_save_path.
+
+The results are JSON keyed by scale and route with sorted keys, so runs can be diffed; compare prints the
+changes and exits 1 when a route's p95 latency or throughput regressed by more than the threshold.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import queue
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synthetic import get_cached_database, make_bio, zipf_cum_weights
+from bulk import iter_export_lines
+from utils import str2list
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+database_name = 'itu_event_biography_db.db'
+# serves main.app like `python main.py`, after pointing the photo and snapshot directories into the work directory
+server_code = """
+import sys
+import backend
+backend.bio_save_path = sys.argv[1]
+backend.snapshot_save_path = sys.argv[3]
+import main
+import uvicorn
+uvicorn.run(main.app, host='127.0.0.1', port=int(sys.argv[2]), log_level='warning')
+"""
+
+
+class Dataset:
+    """
+    What the request builders sample from: the generated bios, events, links and keywords.
+    """
+
+    def __init__(self, database_path, seed):
+        conn = sqlite3.connect(database_path)
+        try:
+            self.seed = seed
+            self.validated = conn.execute('SELECT Email, BiographyID FROM biography_validated '
+                                          'ORDER BY Email').fetchall()
+            self.pending = [row[0] for row in conn.execute('SELECT Email FROM biography_pending ORDER BY Email')]
+            self.events = [row[0] for row in conn.execute('SELECT EventID FROM events ORDER BY EventID')]
+            self.links = conn.execute("""
+            SELECT event_biography.EventID, biography_validated.Email
+             FROM event_biography CROSS JOIN biography_validated
+            WHERE biography_validated.BiographyID=event_biography.BiographyID
+            ORDER BY 1, 2
+            """).fetchall()
+            self.keywords = [row[0] for row in conn.execute("""
+            SELECT itu_keywords.KwText FROM itu_keywords
+            WHERE EXISTS (SELECT 1 FROM biography_keyword WHERE KwID=itu_keywords.KwID)
+            ORDER BY itu_keywords.KwID
+            """)]
+            self.all_keywords = [row[0] for row in conn.execute('SELECT KwText FROM itu_keywords ORDER BY KwID')]
+        finally:
+            conn.close()
+        self.keyword_weights = zipf_cum_weights(len(self.all_keywords))
+        self.words = sorted({word for keyword in self.keywords for word in re.findall(r'[a-z]{4,}', keyword.lower())})
+        self.new_bios = 0
+
+    def counts(self):
+        return {'validated': len(self.validated), 'pending': len(self.pending), 'events': len(self.events),
+                'links': len(self.links)}
+
+    def make_new_bio(self, rng):
+        # bios that are not in the database yet, for the write routes
+        self.new_bios += 1
+        return make_bio(rng, 10 ** 9 + self.new_bios, self.all_keywords, self.keyword_weights, self.seed)
+
+
+def user_data(bio):
+    return json.dumps({**bio, 'Keywords': str2list(bio['Keywords'])})
+
+
+def bios_csv(bios):
+    cols = [col for col in bios[0] if col != 'BiographyID']
+    return ''.join(iter_export_lines(cols, ([bio[col] for col in cols] for bio in bios), 'csv')).encode()
+
+
+def each(build):
+    """
+    make_requests for routes without setup: build(data, rng) per request.
+    """
+    return lambda data, rng, send, count: [build(data, rng) for _ in range(count)]
+
+
+def get(path, **params):
+    return {'method': 'GET', 'url': path, 'params': params}
+
+
+def post(path, **form):
+    return {'method': 'POST', 'url': path, 'data': form}
+
+
+def conditional(build):
+    """
+    Requests of build, each repeated with the ETag of its first response, as a polling client would.
+    """
+    def make_requests(data, rng, send, count):
+        requests = []
+        for _ in range(count):
+            request = build(data, rng)
+            etag = send(request).headers.get('etag')
+            requests.append({**request, 'headers': {'If-None-Match': etag} if etag else {}})
+        return requests
+    return make_requests
+
+
+def pending_bios(data, rng, send, count, event_id):
+    # imported in one unmeasured request, so that the accept routes have bios to accept
+    bios = [data.make_new_bio(rng) for _ in range(count)]
+    send({'method': 'POST', 'url': '/biography/import_bios', 'data': {'event_id': event_id},
+          'files': {'bios_file': ('pending.csv', bios_csv(bios), 'text/csv')}})
+    return bios
+
+
+def accept_bio_requests(data, rng, send, count):
+    bios = pending_bios(data, rng, send, count, rng.choice(data.events))
+    return [post('/biography/accept_bio', user_data=user_data(bio)) for bio in bios]
+
+
+def accept_bios_requests(data, rng, send, count, batch=10):
+    bios = pending_bios(data, rng, send, count * batch, rng.choice(data.events))
+    return [post('/biography/accept_bios', emails=json.dumps([bio['Email'] for bio in bios[start:start + batch]]))
+            for start in range(0, len(bios), batch)]
+
+
+def import_bios_request(data, rng, rows=100):
+    bios = [data.make_new_bio(rng) for _ in range(rows)]
+    request = post('/biography/import_bios', event_id=rng.choice(data.events), biography_status='validated')
+    return {**request, 'files': {'bios_file': ('bios.csv', bios_csv(bios), 'text/csv')}}
+
+
+def validated_emails(data, rng, count):
+    return [email for email, _ in rng.sample(data.validated, min(count, len(data.validated)))]
+
+
+def search_query(data, rng):
+    return ' '.join(rng.sample(data.words, rng.choice([1, 1, 2])))
+
+
+# (route, make_requests(data, rng, send, count)); reads first, as the writes change what they see
+routes = [
+    ('GET /biography/get_events', each(lambda data, rng: get('/biography/get_events'))),
+    ('GET /biography/events_overview', each(lambda data, rng: get('/biography/events_overview'))),
+    ('GET /biography/retrieve_bio_by_email',
+     each(lambda data, rng: get('/biography/retrieve_bio_by_email', user_email=rng.choice(data.validated)[0]))),
+    ('GET /biography/retrieve_bio_by_id',
+     each(lambda data, rng: get('/biography/retrieve_bio_by_id', bio_id=rng.choice(data.validated)[1]))),
+    ('GET /biography/retrieve_bio_by_id [If-None-Match]',
+     conditional(lambda data, rng: get('/biography/retrieve_bio_by_id', bio_id=rng.choice(data.validated)[1]))),
+    ('GET /biography/retrieve_bios',
+     each(lambda data, rng: get('/biography/retrieve_bios', emails=','.join(validated_emails(data, rng, 20))))),
+    ('GET /biography/retrieve_bios_by_event',
+     each(lambda data, rng: get('/biography/retrieve_bios_by_event', event_id=rng.choice(data.events),
+                                biography_status='validated'))),
+    ('GET /biography/retrieve_bios_by_event [If-None-Match]',
+     conditional(lambda data, rng: get('/biography/retrieve_bios_by_event', event_id=rng.choice(data.events),
+                                       biography_status='validated'))),
+    ('GET /biography/retrieve_bios_by_event [page]',
+     each(lambda data, rng: get('/biography/retrieve_bios_by_event', event_id=rng.choice(data.events),
+                                biography_status='validated', limit=50))),
+    ('GET /biography/stream_bios_by_event',
+     each(lambda data, rng: get('/biography/stream_bios_by_event', event_id=rng.choice(data.events),
+                                biography_status='validated'))),
+    ('GET /biography/export',
+     each(lambda data, rng: get('/biography/export', event_id=rng.choice(data.events), biography_status='validated',
+                                format=rng.choice(['csv', 'ndjson'])))),
+    ('GET /biography/search', each(lambda data, rng: get('/biography/search', q=search_query(data, rng)))),
+    ('GET /biography/search [event]',
+     each(lambda data, rng: get('/biography/search', q=search_query(data, rng), event_id=rng.choice(data.events)))),
+    ('GET /biography/bios_by_keyword',
+     each(lambda data, rng: get('/biography/bios_by_keyword', keyword=rng.choice(data.keywords)))),
+    ('GET /biography/keyword_facets',
+     each(lambda data, rng: get('/biography/keyword_facets', event_id=rng.choice(data.events)))),
+    ('GET /biography/keywords',
+     each(lambda data, rng: get('/biography/keywords', q=rng.choice(data.words)[:rng.randint(2, 6)]))),
+    # render_metrics runs on the event loop, with every route above in its histograms
+    ('GET /metrics', each(lambda data, rng: get('/metrics'))),
+    ('GET /biography/generate_invitation',
+     each(lambda data, rng: get('/biography/generate_invitation', even_name=f'Load test {rng.random()}'))),
+    ('POST /biography/save_bio',
+     each(lambda data, rng: post('/biography/save_bio', user_data=user_data(data.make_new_bio(rng)),
+                                 event_id=rng.choice(data.events)))),
+    ('POST /biography/accept_bio', accept_bio_requests),
+    ('POST /biography/accept_bios', accept_bios_requests),
+    ('POST /biography/append_bio_to_event',
+     each(lambda data, rng: post('/biography/append_bio_to_event', event_id=rng.choice(data.events),
+                                 bio_email=rng.choice(data.validated)[0]))),
+    ('POST /biography/remove_bio_from_event',
+     each(lambda data, rng: post('/biography/remove_bio_from_event', **dict(zip(['event_id', 'bio_email'],
+                                                                                rng.choice(data.links)))))),
+    ('POST /biography/append_bios_to_event',
+     each(lambda data, rng: post('/biography/append_bios_to_event', event_id=rng.choice(data.events),
+                                 bio_emails=json.dumps(validated_emails(data, rng, 20))))),
+    ('POST /biography/remove_bios_from_event',
+     each(lambda data, rng: post('/biography/remove_bios_from_event', event_id=rng.choice(data.events),
+                                 bio_emails=json.dumps(validated_emails(data, rng, 20))))),
+    ('POST /biography/import_bios', each(import_bios_request)),
+]
+
+
+def is_error(response):
+    if response.status_code >= 400:
+        return True
+    if response.headers.get('content-type', '').startswith('application/json'):
+        body = response.json()
+        return isinstance(body, dict) and bool(body.get('error_msg'))
+    return False
+
+
+def percentile(sorted_values, share):
+    return sorted_values[max(0, math.ceil(share * len(sorted_values)) - 1)]
+
+
+def measure(send, requests, concurrency):
+    def timed(request):
+        started = time.perf_counter()
+        response = send(request)
+        return time.perf_counter() - started, is_error(response)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, requests))
+    wall_time = time.perf_counter() - started
+    timings = sorted(elapsed * 1e3 for elapsed, _ in outcomes)
+    return {
+        'requests': len(outcomes),
+        'errors': sum(error for _, error in outcomes),
+        'throughput_rps': round(len(outcomes) / wall_time, 1),
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+    }
+
+
+def measure_allocations(send, requests):
+    # one request at a time, so that the peak belongs to it; worker threads are traced too
+    peaks = []
+    tracemalloc.start()
+    try:
+        for request in requests:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            send(request)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return round(percentile(peaks, 0.5) / 1024, 1)
+
+
+def run_routes(send, data, count, concurrency, seed, alloc_samples):
+    results = {}
+    for route, make_requests in routes:
+        rng = random.Random(f'{seed}-{route}')
+        requests = make_requests(data, rng, send, count + alloc_samples)
+        results[route] = measure(send, requests[:count], concurrency)
+        results[route]['alloc_peak_kib'] = measure_allocations(send, requests[count:]) if alloc_samples else None
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(client, process, timeout=120):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'the server exited with {process.returncode}')
+        try:
+            if client.get('/biography/get_events').status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('the server did not start')
+
+
+def run_scale(mode, database_path, count, concurrency, seed):
+    import httpx
+
+    work_dir = tempfile.mkdtemp(prefix='biography-load-')
+    previous_dir = os.getcwd()
+    try:
+        shutil.copyfile(database_path, os.path.join(work_dir, database_name))
+        photos_dir = os.path.join(work_dir, 'speaker_data_files')
+        snapshots_dir = os.path.join(work_dir, 'snapshots')
+        data = Dataset(database_path, seed)
+        if mode == 'http':
+            port = free_port()
+            process = subprocess.Popen([sys.executable, '-c', server_code, photos_dir, str(port), snapshots_dir],
+                                       cwd=work_dir, env={**os.environ, 'PYTHONPATH': repo_dir})
+            # keep-alive clients created up front: building one (and its SSL context) takes far longer than a request
+            clients = queue.Queue()
+            for _ in range(concurrency):
+                clients.put(httpx.Client(base_url=f'http://127.0.0.1:{port}', timeout=300))
+
+            def send(request):
+                client = clients.get()
+                try:
+                    return client.request(**request)
+                finally:
+                    clients.put(client)
+
+            try:
+                with httpx.Client(base_url=f'http://127.0.0.1:{port}') as probe:
+                    wait_for_server(probe, process)
+                return data.counts(), run_routes(send, data, count, concurrency, seed, alloc_samples=0)
+            finally:
+                while not clients.empty():
+                    clients.get().close()
+                process.terminate()
+                process.wait()
+
+        # main opens its database relative to the working directory when the app starts
+        os.chdir(work_dir)
+        import backend
+        backend.bio_save_path = photos_dir
+        backend.snapshot_save_path = snapshots_dir
+        from fastapi.testclient import TestClient
+        import main
+        with TestClient(main.app) as client:
+            return data.counts(), run_routes(lambda request: client.request(**request), data, count, concurrency,
+                                             seed, alloc_samples=min(20, count))
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run(mode='inprocess', scales=(1000, 10000, 100000), count=200, concurrency=4, seed=0, data_dir=None):
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), 'biography-benchmarks')
+    results = {
+        'meta': {'mode': mode, 'requests': count, 'concurrency': concurrency, 'seed': seed,
+                 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                 'machine': platform.machine()},
+        'scales': {}
+    }
+    for bios in scales:
+        database_path = get_cached_database(data_dir, bios, seed=seed,
+                                            template_path=os.path.join(repo_dir, database_name))
+        dataset, route_results = run_scale(mode, database_path, count, concurrency, seed)
+        results['scales'][str(bios)] = {'dataset': dataset, 'routes': route_results}
+    return results
+
+
+def compare(baseline, current, threshold=0.25, noise_ms=1.0):
+    """
+    Lines describing the p95 and throughput changes of every route in both results, and whether any of them
+    regressed by more than threshold (p95 changes below noise_ms are ignored).
+    """
+    lines = []
+    regressed = False
+    for scale, scale_results in current['scales'].items():
+        baseline_routes = baseline['scales'].get(scale, {}).get('routes', {})
+        for route, result in scale_results['routes'].items():
+            if route not in baseline_routes:
+                continue
+            old = baseline_routes[route]
+            slower = result['p95_ms'] > old['p95_ms'] * (1 + threshold) and \
+                result['p95_ms'] - old['p95_ms'] > noise_ms
+            fewer = result['throughput_rps'] < old['throughput_rps'] / (1 + threshold)
+            regressed = regressed or slower or fewer
+            lines.append(f'{"REGRESSED" if slower or fewer else "ok":>9} {scale:>7} {route:<56} '
+                         f'p95 {old["p95_ms"]:>9} -> {result["p95_ms"]:<9} ms  '
+                         f'{old["throughput_rps"]:>8} -> {result["throughput_rps"]} req/s')
+    return lines, regressed
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, repo_dir)
+    if sys.argv[1:2] == ['compare']:
+        parser = argparse.ArgumentParser(prog='python -m benchmarks.load compare')
+        parser.add_argument('baseline')
+        parser.add_argument('current')
+        parser.add_argument('--threshold', type=float, default=0.25)
+        args = parser.parse_args(sys.argv[2:])
+        with open(args.baseline) as baseline_file, open(args.current) as current_file:
+            report, any_regressed = compare(json.load(baseline_file), json.load(current_file), args.threshold)
+        print('\n'.join(report))
+        sys.exit(1 if any_regressed else 0)
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load')
+    parser.add_argument('--mode', choices=['inprocess', 'http'], default='inprocess')
+    parser.add_argument('--scales', default='1000,10000,100000')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    output = json.dumps(run(args.mode, [int(scale) for scale in args.scales.split(',')], args.requests,
+                            args.concurrency, args.seed, args.data_dir), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
@@ -0,0 +1,122 @@
+"""
+CPU time per 1,000 roster rows of turning database rows into a JSON response body, before and after the row
+projectors and dump_json:
+
+    before  get_list_of_dict, then the former post_process_biography and os.path.join per row, then FastAPI's
+            jsonable_encoder and JSONResponse
+    after   get_row_projector and utils.dump_json, as FastJSONResponse renders it
+
+    python -m benchmarks.serialization [--bios 10000] [--rows 1000] [--repeat 20] [--seed 0] [--data-dir DIR]
+
+The rows are the largest validated roster of a synthetic database (benchmarks.synthetic), a third of them with
+a photo, fetched once: only the mapping and the encoding are timed, in process CPU seconds.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend import biography_cols, get_row_projector, roster_fields
+from benchmarks.synthetic import get_cached_database
+from config import photo_variant_format, photo_variant_sizes, photo_variants_dir_name, profile_photo_url_base, \
+    profile_url_base
+from utils import dump_json, form_response, get_list_of_dict, str2list
+
+
+def get_roster_rows(database_path, count):
+    conn = sqlite3.connect(database_path)
+    try:
+        event_id = conn.execute('SELECT EventID FROM event_biography GROUP BY EventID '
+                                'ORDER BY count(*) DESC LIMIT 1').fetchone()[0]
+        rows = conn.execute(f"""
+        SELECT {', '.join(f'biography_validated.{col}' for col in biography_cols)}
+         FROM event_biography CROSS JOIN biography_validated
+        WHERE biography_validated.BiographyID=event_biography.BiographyID AND event_biography.EventID=?
+        ORDER BY biography_validated.LastName, biography_validated.FirstName
+        LIMIT ?
+        """, (event_id, count)).fetchall()
+    finally:
+        conn.close()
+    photo_position, hash_position = biography_cols.index('PersonalPhotoName'), biography_cols.index('PhotoHash')
+    # synthetic bios have no photos; give a third of them one, so the URL building is part of the work
+    return [row[:photo_position] + ('profile_photo.jpg',) + row[photo_position + 1:hash_position] +
+            (f'{index:064x}',) + row[hash_position + 1:] if index % 3 == 0 else row
+            for index, row in enumerate(rows)]
+
+
+def map_before(rows):
+    # retrieve_bios_by_event's row mapping before the projectors: the former post_process_biography, its
+    # get_photo_path and the old get_variant_urls, inlined
+    biographies = get_list_of_dict(keys=biography_cols, list_of_tuples=rows)
+    for biography in biographies:
+        biography['Keywords'] = str2list(biography['Keywords'])
+        if biography['PersonalPhotoName']:
+            biography['PersonalPhotoName'] = os.path.join(profile_photo_url_base, biography['BiographyID'],
+                                                          'profile_photo', biography['PersonalPhotoName'])
+        else:
+            biography['PersonalPhotoName'] = ''
+        photo_hash = biography.pop('PhotoHash')
+        biography['PhotoVariants'] = {
+            variant: os.path.join(profile_photo_url_base, photo_variants_dir_name, photo_hash[:2],
+                                  f'{photo_hash}-{variant}.{photo_variant_format.lower()}')
+            for variant in photo_variant_sizes} if photo_hash else {}
+        biography['ProfileULR'] = os.path.join(profile_url_base, biography.get('BiographyID'))
+    return biographies
+
+
+def map_after(rows):
+    project = get_row_projector(tuple(biography_cols), tuple(roster_fields))
+    return [project(row) for row in rows]
+
+
+def encode_before(biographies):
+    return JSONResponse(content=jsonable_encoder(form_response(data=biographies, success_msg='success'))).body
+
+
+def encode_after(biographies):
+    return dump_json(form_response(data=biographies, success_msg='success'))
+
+
+def cpu_ms_per_1000_rows(func, argument, rows, repeat):
+    func(argument)
+    start = time.process_time()
+    for _ in range(repeat):
+        func(argument)
+    return round((time.process_time() - start) / repeat / rows * 1000 * 1000, 3)
+
+
+def run(database_path, count=1000, repeat=20):
+    rows = get_roster_rows(database_path, count)
+    before, after = map_before(rows), map_after(rows)
+    if json.loads(encode_before(before)) != json.loads(encode_after(after)):
+        raise AssertionError('the projected rows differ from the post-processed ones')
+
+    results = {'rows': len(rows)}
+    for name, map_rows, encode in [('before', map_before, encode_before), ('after', map_after, encode_after)]:
+        mapped = map_rows(rows)
+        results[name] = {
+            'map_ms': cpu_ms_per_1000_rows(map_rows, rows, len(rows), repeat),
+            'encode_ms': cpu_ms_per_1000_rows(encode, mapped, len(rows), repeat),
+            'total_ms': cpu_ms_per_1000_rows(lambda argument: encode(map_rows(argument)), rows, len(rows), repeat),
+        }
+    results['speedup'] = round(results['before']['total_ms'] / results['after']['total_ms'], 1)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.serialization')
+    parser.add_argument('--bios', type=int, default=10000)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), 'biography-benchmarks')
+    database_path = get_cached_database(data_dir, args.bios, seed=args.seed)
+    print(json.dumps(run(database_path, count=args.rows, repeat=args.repeat), indent=2, sort_keys=True))
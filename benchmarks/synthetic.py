@@ -0,0 +1,142 @@
+"""
+Deterministic synthetic biography databases for the benchmarks: events, validated and pending bios with
+realistic text, and keyword lists drawn from itu_keywords. The same arguments always produce the same rows.
+
+    python -m benchmarks.synthetic <output_path> [bios] [events] [seed]
+"""
+import itertools
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import uuid
+
+from migrations import apply_migrations
+from utils import list2str, transaction
+
+first_names = ['Amina', 'Carlos', 'Chen', 'Daniela', 'David', 'Elena', 'Fatima', 'Hiroshi', 'Ibrahim', 'Ines',
+               'Jean', 'Julia', 'Kwame', 'Lars', 'Leila', 'Lucas', 'Maria', 'Mateo', 'Mei', 'Mohammed', 'Nadia',
+               'Olga', 'Omar', 'Priya', 'Rafael', 'Rania', 'Sara', 'Sergei', 'Sofia', 'Tomás', 'Wei', 'Yuki',
+               'Zanele', 'Aditya', 'Beatriz', 'Dmitri', 'Emeka', 'Grace', 'Hannah', 'Javier']
+last_names = ['Abdullah', 'Adeyemi', 'Alvarez', 'Andersson', 'Bianchi', 'Chen', 'Dubois', 'Fernández', 'García',
+              'Haddad', 'Ivanova', 'Jensen', 'Kim', 'Kowalski', 'Kumar', 'Le', 'Mensah', 'Müller', 'Nakamura',
+              'Nguyen', 'Okafor', 'Olsen', 'Park', 'Patel', 'Pereira', 'Rossi', 'Sato', 'Schmidt', 'Singh',
+              'Smith', 'Tanaka', 'Wang', 'Yilmaz', 'Zhang', "O'Brien", 'Van der Berg', 'Al-Farsi', 'Mwangi']
+titles = ['Dr.', 'Prof.', 'Mr.', 'Ms.', 'Eng.', None]
+job_titles = ['Senior Engineer', 'Head of Spectrum Policy', 'Research Scientist', 'Chief Technology Officer',
+              'Standards Manager', 'Director of Regulatory Affairs', 'Network Architect', 'Policy Advisor',
+              'Professor', 'Programme Officer', 'Project Manager', 'Rapporteur', 'Study Group Chair']
+organizations = ['National Regulatory Authority', 'Ministry of Communications', 'Telecom Operator Group',
+                 'Institute of Technology', 'Satellite Systems Ltd', 'Standards Consortium', 'University Research Lab',
+                 'Broadcasting Union', 'Network Equipment Vendor', 'Digital Development Agency']
+countries = [('Kenya', 'Africa'), ('Nigeria', 'Africa'), ('South Africa', 'Africa'), ('Brazil', 'Americas'),
+             ('Canada', 'Americas'), ('Chile', 'Americas'), ('United States', 'Americas'), ('China', 'Asia-Pacific'),
+             ('India', 'Asia-Pacific'), ('Japan', 'Asia-Pacific'), ('Korea', 'Asia-Pacific'), ('Egypt', 'Arab States'),
+             ('Saudi Arabia', 'Arab States'), ('France', 'Europe'), ('Germany', 'Europe'), ('Switzerland', 'Europe'),
+             ('Russian Federation', 'CIS'), ('Kazakhstan', 'CIS')]
+genders = ['Female', 'Male']
+sentences = [
+    '{name} is {job} at {org}, based in {country}.',
+    '{name} has worked on {kw0} for more than {years} years.',
+    'Current work focuses on {kw0} and {kw1}, with contributions to several ITU study groups.',
+    '{name} chairs a working party on {kw1} and regularly speaks about {kw0}.',
+    'Before joining {org}, {name} led projects on {kw2} across the {region} region.',
+    '{name} holds a doctorate in electrical engineering and has published widely on {kw1}.',
+    'Research interests include {kw0}, {kw2} and the regulation of emerging technologies.',
+    '{name} advises governments on {kw2} and digital inclusion.',
+]
+
+
+def zipf_cum_weights(count, exponent=1.0):
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def make_bio(rng, index, keywords, keyword_weights, seed):
+    first_name, last_name = rng.choice(first_names), rng.choice(last_names)
+    email = f'{first_name}.{last_name}.{index}@example.org'.lower().replace(' ', '').replace("'", '')
+    country, region = rng.choice(countries)
+    tags = list(dict.fromkeys(rng.choices(keywords, cum_weights=keyword_weights, k=rng.randint(2, 6))))
+    job_title = rng.choice(job_titles)
+    words = {'name': f'{first_name} {last_name}', 'job': job_title.lower(),
+             'org': rng.choice(organizations), 'country': country, 'region': region, 'years': rng.randint(3, 25),
+             **{f'kw{position}': tags[position % len(tags)].lower() for position in range(3)}}
+    text = ' '.join(sentence.format(**words) for sentence in rng.sample(sentences, rng.randint(3, len(sentences))))
+    return {
+        'BiographyID': uuid.uuid5(uuid.NAMESPACE_DNS, f'{seed}-{email}').hex,
+        'FirstName': first_name,
+        'LastName': last_name,
+        'Title': rng.choice(titles),
+        'JobTitle': job_title,
+        'Email': email,
+        'Country': country,
+        'Region': region,
+        'Gender': rng.choice(genders),
+        'Organization': words['org'],
+        'LinkedInPage': f'https://www.linkedin.com/in/{email.split("@")[0]}',
+        'Keywords': list2str(tags),
+        'Biography': text,
+    }
+
+
+def generate(output_path, bios=1000, events=None, seed=0, template_path='itu_event_biography_db.db',
+             pending_share=0.2):
+    """
+    Writes a database of `bios` bios (pending_share of them pending) linked to 1-3 of `events` events,
+    whose sizes follow a Zipf distribution, to output_path. The schema and itu_keywords come from
+    template_path. Returns {'events', 'validated', 'pending', 'links'}.
+    """
+    events = events or max(5, bios // 200)
+    rng = random.Random(seed)
+    shutil.copyfile(template_path, output_path)
+    conn = sqlite3.connect(output_path)
+    try:
+        apply_migrations(conn)
+        keywords = [row[0] for row in conn.execute('SELECT min(KwText) FROM itu_keywords GROUP BY KwText '
+                                                   'COLLATE NOCASE ORDER BY min(KwID)')]
+        keyword_weights = zipf_cum_weights(len(keywords))
+        event_ids = [uuid.uuid5(uuid.NAMESPACE_DNS, f'{seed}-event-{index}').hex for index in range(events)]
+        event_weights = zipf_cum_weights(events, exponent=0.8)
+
+        bio_cols = list(make_bio(random.Random(0), 0, keywords, keyword_weights, seed))
+        insert_sql = {status: f'INSERT INTO biography_{status} ({", ".join(bio_cols)}) '
+                              f'VALUES ({", ".join("?" * len(bio_cols))})' for status in ['pending', 'validated']}
+        counts = {'events': events, 'validated': 0, 'pending': 0, 'links': 0}
+        with transaction(conn):
+            for table in ['event_biography', 'biography_pending', 'biography_validated', 'events']:
+                conn.execute(f'DELETE FROM {table}')
+            conn.executemany('INSERT INTO events (EventID, EventName, CreateDate) VALUES (?, ?, ?)',
+                             [(event_id, f'Synthetic event {index}', f'2024-01-01 00:{index // 60 % 60:02}:'
+                                                                     f'{index % 60:02}')
+                              for index, event_id in enumerate(event_ids)])
+            links = set()
+            for index in range(bios):
+                bio = make_bio(rng, index, keywords, keyword_weights, seed)
+                status = 'pending' if rng.random() < pending_share else 'validated'
+                conn.execute(insert_sql[status], [bio[col] for col in bio_cols])
+                counts[status] += 1
+                for event_id in rng.choices(event_ids, cum_weights=event_weights, k=rng.randint(1, 3)):
+                    links.add((event_id, bio['BiographyID']))
+            conn.executemany('INSERT INTO event_biography (EventID, BiographyID) VALUES (?, ?)', sorted(links))
+            counts['links'] = len(links)
+    finally:
+        conn.close()
+    return counts
+
+
+def get_cached_database(data_dir, bios, events=None, seed=0, template_path='itu_event_biography_db.db'):
+    """
+    Path of the generated database for these arguments, generating it on first use.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'bios-{bios}-events-{events or "auto"}-seed-{seed}.db')
+    if not os.path.exists(path):
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        generate(temp_path, bios=bios, events=events, seed=seed, template_path=template_path)
+        os.replace(temp_path, path)
+    return path
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    print(generate(args[0], *[int(arg) for arg in args[1:4]]))
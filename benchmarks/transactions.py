@@ -0,0 +1,83 @@
+"""
+Commits and latency of an accept_biography-shaped unit of work, with the helpers committing every
+statement (as before) and grouped in one utils.transaction() block.
+
+    python -m benchmarks.transactions [database_path] [requests] [synchronous]
+"""
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from config import db_pragmas
+from migrations import apply_migrations
+from utils import generate_id, sqlite_delete, sqlite_insert, sqlite_select, transaction
+
+bio_cols = ['BiographyID', 'FirstName', 'LastName', 'Email', 'Keywords', 'Biography']
+
+
+def accept(conn, request):
+    email = f'benchmark-{request}@example.org'
+    biography_id = generate_id(email)
+    bio = {'BiographyID': biography_id, 'FirstName': 'Bench', 'LastName': f'Mark {request}', 'Email': email,
+           'Keywords': 'benchmark', 'Biography': 'x' * 500}
+    sqlite_insert(conn=conn, table='biography_pending', rows=bio, replace_existing=True)
+    sqlite_select(conn, table='biography_pending', cols=['BiographyID'], conds={'Email': email})
+    sqlite_select(conn, table='biography_validated', cols=['BiographyID'], conds={'Email': email})
+    sqlite_insert(conn=conn, table='biography_validated', rows=bio, replace_existing=True)
+    sqlite_delete(conn=conn, table='biography_pending', conds={'BiographyID': biography_id})
+
+
+def time_requests(conn, count, grouped, first_request):
+    commits = []
+    conn.set_trace_callback(lambda statement: commits.append(statement) if statement == 'COMMIT' else None)
+    timings = []
+    for request in range(first_request, first_request + count):
+        started = time.perf_counter()
+        if grouped:
+            with transaction(conn):
+                accept(conn, request)
+        else:
+            accept(conn, request)
+        timings.append((time.perf_counter() - started) * 1e6)
+    conn.set_trace_callback(None)
+    timings.sort()
+    return {
+        'commits_per_request': round(len(commits) / count, 2),
+        'p50_us': round(statistics.median(timings), 1),
+        'p99_us': round(timings[int(len(timings) * 0.99) - 1], 1),
+        'max_us': round(timings[-1], 1)
+    }
+
+
+def run(database_path='itu_event_biography_db.db', count=1000, synchronous=db_pragmas.get('synchronous')):
+    # work on a copy: the benchmark writes bios
+    work_dir = tempfile.mkdtemp()
+    try:
+        copy_path = os.path.join(work_dir, 'benchmark.db')
+        shutil.copyfile(database_path, copy_path)
+        conn = sqlite3.connect(copy_path)
+        for pragma, value in {**db_pragmas, 'synchronous': synchronous}.items():
+            conn.execute(f'PRAGMA {pragma}={value}')
+        apply_migrations(conn)
+        results = {
+            'requests': count,
+            'synchronous': synchronous,
+            'per_statement': time_requests(conn, count, grouped=False, first_request=0),
+            'transaction': time_requests(conn, count, grouped=True, first_request=count)
+        }
+        conn.close()
+        return results
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    results = run(*args[:1], *[int(arg) for arg in args[1:2]], *args[2:3])
+    for name in ['per_statement', 'transaction']:
+        print(f'{name:>14}: {results[name]}')
+    print(f'{"":>14}  {results["requests"]} requests, synchronous={results["synchronous"]}')
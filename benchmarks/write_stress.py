@@ -0,0 +1,229 @@
+"""
+Multi-process write stress test: several worker processes, each with its own UserBiographySystem like a uvicorn
+worker, save and accept biographies on one synthetic database at the same time.
+
+    python -m benchmarks.write_stress [--workers 4,8] [--writes 100] [--threads 2] [--bios 1000]
+                                      [--no-lock-file] [--data-dir DIR] [--output results.json]
+
+Every write cycle saves a pending bio for a new email, linked to an event, and accepts it with a changed
+FirstName. Afterwards the database must hold exactly the expected validated bios and links, and none of them
+pending: a lost or half-applied write fails the run (exit 1), as does any error such as "database is locked".
+Each worker also reads every bio and roster through its cached API before the writes start and once all of
+them are done: the second reads must show every worker's writes, so a stale cache entry fails the run too.
+--no-lock-file leaves the processes to SQLite's busy timeout, to compare with the cross-process write lock.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.load import percentile
+from benchmarks.synthetic import get_cached_database
+from config import cache_data_version_interval, write_executor_workers
+
+stress_domain = 'stress.example.org'
+
+
+def get_email(worker, index):
+    return f'writer-{worker}-{index}@{stress_domain}'
+
+
+def check_reads(biography_system, workers, writes, event_ids):
+    """
+    Differences between what biography_system serves, cache included, and the writes the workers made.
+    """
+    problems = []
+    expected_rosters = {event_id: set() for event_id in event_ids}
+    for worker in range(workers):
+        for index in range(writes):
+            email = get_email(worker, index)
+            expected_rosters[event_ids[index % len(event_ids)]].add(email)
+            bio = biography_system.retrieve_bio_by_email(email)['data']
+            if bio.get('FirstName') != f'Accepted {index}':
+                problems.append(f'{email}: read FirstName {bio.get("FirstName")!r} by email')
+            elif biography_system.retrieve_bio_by_id(bio['BiographyID'])['data'].get('FirstName') != \
+                    f'Accepted {index}':
+                problems.append(f'{email}: read a stale bio by ID')
+    for event_id, expected in expected_rosters.items():
+        for biography_status, expected_emails in [('validated', expected), ('pending', set())]:
+            roster = biography_system.retrieve_bios_by_event(event_id, biography_status)['data']
+            emails = {bio['Email'] for bio in roster if bio['Email'].endswith(f'@{stress_domain}')}
+            if emails != expected_emails:
+                problems.append(f'{event_id}: read {len(emails)} {biography_status} stress bios in the roster, '
+                                f'expected {len(expected_emails)}')
+    return problems
+
+
+def run_worker(database_path, work_dir, worker, workers, writes, threads, event_ids, lock_file, ready, start,
+               results, verify, checks):
+    """
+    Runs in a spawned process: fills its cache, waits for start, then runs `writes` save + accept cycles on
+    `threads` threads, the way the write executor of one uvicorn worker would, and puts its latencies and errors
+    on results. Once verify is set, i.e. every worker is done writing, it puts what check_reads found on checks.
+    """
+    import backend
+    backend.bio_save_path = os.path.join(work_dir, 'photos')
+    backend.snapshot_save_path = os.path.join(work_dir, 'snapshots')
+    backend.db_write_lock_file = lock_file
+    biography_system = backend.UserBiographySystem(database_path=database_path)
+
+    def cycle(index):
+        bio = {'Email': get_email(worker, index), 'FirstName': 'Pending', 'LastName': f'Writer {worker}',
+               'Keywords': ['5G']}
+        timings, errors = [], []
+        for call, args in [(biography_system.save_biography, (bio, None, event_ids[index % len(event_ids)], False)),
+                           (biography_system.accept_biography, ({**bio, 'FirstName': f'Accepted {index}'}, None,
+                                                                False))]:
+            started = time.perf_counter()
+            try:
+                response = call(*args)
+                error_msg = response['error_msg'] if response else 'no response'
+            except Exception as ex:
+                error_msg = f'{type(ex).__name__}: {ex}'
+            timings.append((time.perf_counter() - started) * 1000)
+            if error_msg:
+                errors.append(error_msg)
+        return timings, errors
+
+    try:
+        # cached before any write, so only an entry that notices the other workers' writes reads them
+        check_reads(biography_system, workers, writes, event_ids)
+        ready.put(worker)
+        start.wait()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            outcomes = list(executor.map(cycle, range(writes)))
+        results.put((worker, [timing for timings, _ in outcomes for timing in timings],
+                     [error for _, errors in outcomes for error in errors]))
+        verify.wait()
+        # a process only looks for the others' writes every cache_data_version_interval
+        time.sleep(cache_data_version_interval)
+        checks.put((worker, check_reads(biography_system, workers, writes, event_ids)))
+    finally:
+        biography_system.close()
+
+
+def check_writes(database_path, workers, writes, event_ids):
+    """
+    Differences between the database and the writes the workers made, as a list of messages.
+    """
+    conn = sqlite3.connect(database_path)
+    try:
+        pending = conn.execute('SELECT count(*) FROM biography_pending WHERE Email LIKE ?',
+                               (f'%@{stress_domain}',)).fetchone()[0]
+        validated = dict(conn.execute('SELECT Email, FirstName FROM biography_validated WHERE Email LIKE ?',
+                                      (f'%@{stress_domain}',)))
+        links = set(conn.execute("""
+        SELECT biography_validated.Email, event_biography.EventID
+         FROM biography_validated CROSS JOIN event_biography
+        WHERE biography_validated.Email LIKE ? AND event_biography.BiographyID=biography_validated.BiographyID
+        """, (f'%@{stress_domain}',)))
+    finally:
+        conn.close()
+
+    problems = [f'{pending} bios left pending'] if pending else []
+    for worker in range(workers):
+        for index in range(writes):
+            email = get_email(worker, index)
+            if validated.get(email) != f'Accepted {index}':
+                problems.append(f'{email}: validated FirstName is {validated.get(email)!r}')
+            if (email, event_ids[index % len(event_ids)]) not in links:
+                problems.append(f'{email}: not linked to its event')
+    return problems
+
+
+def wait_for(messages, processes, timeout=600):
+    # a worker that crashed never reports, so check on them while waiting
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return messages.get(timeout=1)
+        except queue.Empty:
+            if any(process.exitcode not in (None, 0) for process in processes):
+                raise RuntimeError('a worker process failed; see its traceback above')
+    raise TimeoutError(f'no worker reported within {timeout}s')
+
+
+def run_stress(database_path, workers, writes, threads, lock_file=True):
+    work_dir = tempfile.mkdtemp(prefix='biography-stress-')
+    try:
+        work_path = os.path.join(work_dir, os.path.basename(database_path))
+        shutil.copyfile(database_path, work_path)
+        conn = sqlite3.connect(work_path)
+        event_ids = [row[0] for row in conn.execute('SELECT EventID FROM events ORDER BY EventID LIMIT 8')]
+        conn.close()
+
+        # spawn, as uvicorn does for --workers: nothing is inherited from this process
+        context = multiprocessing.get_context('spawn')
+        ready, start, results = context.Queue(), context.Event(), context.Queue()
+        verify, checks = context.Event(), context.Queue()
+        processes = [context.Process(target=run_worker,
+                                     args=(work_path, work_dir, worker, workers, writes, threads, event_ids,
+                                           lock_file, ready, start, results, verify, checks))
+                     for worker in range(workers)]
+        try:
+            for process in processes:
+                process.start()
+            for _ in processes:
+                wait_for(ready, processes)
+            started = time.perf_counter()
+            start.set()
+            outcomes = [wait_for(results, processes) for _ in processes]
+            elapsed = time.perf_counter() - started
+            verify.set()
+            stale_reads = [problem for _ in processes for problem in wait_for(checks, processes)[1]]
+        finally:
+            for process in processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+
+        timings = sorted(timing for _, worker_timings, _ in outcomes for timing in worker_timings)
+        errors = [error for _, _, worker_errors in outcomes for error in worker_errors]
+        problems = check_writes(work_path, workers, writes, event_ids)
+        return {
+            'workers': workers,
+            'writes': len(timings),
+            'errors': len(errors),
+            'error_samples': sorted(set(errors))[:5],
+            'lost_writes': len(problems),
+            'problem_samples': problems[:5],
+            'stale_reads': len(stale_reads),
+            'stale_read_samples': stale_reads[:5],
+            'writes_per_s': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'max_ms': round(timings[-1], 2),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.write_stress')
+    parser.add_argument('--workers', default='4,8')
+    parser.add_argument('--writes', type=int, default=100, help='save + accept cycles per worker process')
+    parser.add_argument('--threads', type=int, default=write_executor_workers)
+    parser.add_argument('--bios', type=int, default=1000)
+    parser.add_argument('--no-lock-file', action='store_true')
+    parser.add_argument('--data-dir')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), 'biography-benchmarks')
+    database_path = get_cached_database(data_dir, args.bios)
+    report = [run_stress(database_path, int(workers), args.writes, args.threads, lock_file=not args.no_lock_file)
+              for workers in args.workers.split(',')]
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    sys.exit(1 if any(result['errors'] or result['lost_writes'] or result['stale_reads'] for result in report) else 0)
@@ -0,0 +1,117 @@
+"""
+Streaming CSV / NDJSON readers and writers for bulk biography import and export.
+
+    python bulk.py import <file> <event_id> [pending|validated]
+    python bulk.py export <file> <table>
+    python bulk.py export <file> <event_id> <pending|validated>
+
+The file format follows the extension (.csv, or .ndjson/.jsonl); "-" reads stdin or writes stdout as CSV.
+"""
+import csv
+import io
+import json
+import re
+
+bulk_formats = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+# bytes that are not UTF-8 are decoded to these lone surrogates (errors='surrogateescape')
+undecodable_bytes = re.compile('[\udc80-\udcff]')
+
+
+def get_bulk_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'jsonl':
+        return 'ndjson'
+    return extension if extension in bulk_formats else default
+
+
+def iter_import_rows(source, file_format):
+    """
+    Reads a binary file object one row at a time and yields (line, row dict, error message); row is None
+    when the line could not be parsed, or is not UTF-8.
+    """
+    text = io.TextIOWrapper(source, encoding='utf-8-sig', errors='surrogateescape', newline='')
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(text)
+            try:
+                for row in reader:
+                    if any(undecodable_bytes.search(value) for value in [*row, *row.values()]
+                           if isinstance(value, str)):
+                        yield reader.line_num, None, 'invalid UTF-8'
+                        continue
+                    yield reader.line_num, row, ''
+            except csv.Error as ex:
+                yield reader.line_num, None, f'invalid CSV: {ex}'
+        else:
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                if undecodable_bytes.search(line):
+                    yield line_number, None, 'invalid UTF-8'
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as ex:
+                    yield line_number, None, f'invalid JSON: {ex}'
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None, 'each line must be a JSON object'
+                    continue
+                yield line_number, row, ''
+    finally:
+        # the caller owns the file; only the wrapper is dropped
+        text.detach()
+
+
+def iter_export_lines(cols, rows, file_format):
+    """
+    Encodes rows (tuples in cols order) one line at a time, starting with the header for CSV.
+    """
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(cols)
+        yield buffer.getvalue()
+        for row in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            yield buffer.getvalue()
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(cols, row))) + '\n'
+
+
+if __name__ == "__main__":
+    import sys
+
+    from backend import UserBiographySystem
+
+    command, path, *args = sys.argv[1:]
+    biography_system = UserBiographySystem(database_path='itu_event_biography_db.db')
+    try:
+        if command == 'import':
+            event_id, biography_status = args[0], (args[1:] or ['pending'])[0]
+            with (open(path, 'rb') if path != '-' else sys.stdin.buffer) as f:
+                response = biography_system.import_biographies(f, get_bulk_format(path), event_id,
+                                                               biography_status=biography_status)
+            for error in response['data'].get('errors', []):
+                print(f'line {error["line"]}: {error["error"]}', file=sys.stderr)
+            print(response['error_msg'] or f'imported {response["data"]["imported"]} biographies', file=sys.stderr)
+            sys.exit(1 if response['error_msg'] else 0)
+
+        table, event_id, biography_status = (args[0], None, None) if len(args) == 1 else (None, *args[:2])
+        file_format = get_bulk_format(path)
+        error_response = biography_system.check_export(table=table, event_id=event_id,
+                                                       biography_status=biography_status)
+        if error_response:
+            print(error_response['error_msg'], file=sys.stderr)
+            sys.exit(1)
+        with (open(path, 'w', encoding='utf-8', newline='') if path != '-' else sys.stdout) as f:
+            f.writelines(biography_system.iter_export(table=table, event_id=event_id,
+                                                      biography_status=biography_status, file_format=file_format))
+    finally:
+        biography_system.close()
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a time-to-live on every entry.
+
+    get_or_load() only stores a freshly loaded value when no invalidate() ran while it was loading, so a read
+    racing with a write can never put the pre-write value back into the cache.
+
+    invalidate() only reaches this process's cache. With generation, a callable returning a value that changes
+    whenever the data may have been changed from anywhere, an entry loaded under an older generation is only
+    served again once revalidate(value) confirms it is still current; otherwise it is reloaded.
+    """
+
+    def __init__(self, max_size=4096, ttl=60, generation=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = generation
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._counters = {
+            'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0, 'revalidations': 0,
+            'stale': 0
+        }
+
+    def _get_generation(self):
+        return self.generation() if self.generation is not None else None
+
+    def get(self, key, revalidate=None):
+        generation = self._get_generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return False, None
+            expires_at, entry_generation, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return False, None
+            if entry_generation == generation:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return True, value
+
+        # written to since it was loaded: revalidate outside the lock, it may query the database
+        current = revalidate is not None and revalidate(value)
+        with self._lock:
+            if self._entries.get(key) is entry:
+                if current:
+                    self._entries[key] = (expires_at, generation, value)
+                    self._entries.move_to_end(key)
+                else:
+                    del self._entries[key]
+            if current:
+                self._counters['revalidations'] += 1
+                self._counters['hits'] += 1
+                return True, value
+            self._counters['stale'] += 1
+            self._counters['misses'] += 1
+            return False, None
+
+    def put(self, key, value, epoch=None, generation=None):
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def get_or_load(self, key, loader, cacheable=None, revalidate=None):
+        found, value = self.get(key, revalidate)
+        if found:
+            return value
+        # read before loading, so a write committed during the load leaves the entry behind the generation
+        generation = self._get_generation()
+        with self._lock:
+            epoch = self._epoch
+        value = loader()
+        if cacheable is None or cacheable(value):
+            self.put(key, value, epoch=epoch, generation=generation)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'size': len(self._entries),
+                **self._counters
+            }
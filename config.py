@@ -6,5 +6,81 @@ profile_photo_url_base = 'https://www.itu.int/itad/BiographySelfservice/speaker_
 profile_url_base = 'http://localhost:8101/#/user/'
 # bio_save_path = 'D:/BiographySelfservice/speaker_data_files/'
 bio_save_path = '/var/www/html/BiographySelfservice/speaker_data_files/'
+# static JSON snapshots of the validated rosters and bios (see snapshots.py); empty to disable them
+snapshot_save_path = '/var/www/html/BiographySelfservice/snapshots/'
 
 ALLOWED_PHOTO_EXTENSIONS = set(['png', 'jpg', 'jpeg'])
+
+db_pool_size = 10
+db_pool_timeout = 30
+# serialize write transactions across worker processes with an flock on <database>-writelock (POSIX only);
+# without it, processes only wait for each other through the busy timeout (db_pool_timeout)
+db_write_lock_file = True
+db_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 268435456,
+    'cache_size': -16000,
+}
+
+# thread pools running the blocking backend calls; requests beyond workers + queue get a 503 with Retry-After
+read_executor_workers = 8
+read_executor_queue = 64
+write_executor_workers = 2
+write_executor_queue = 32
+executor_retry_after = 1
+
+# autocomplete: seconds between checks of itu_keywords for changes, and typos tolerated when few exact matches
+keyword_index_check_interval = 5
+keyword_max_typos = 1
+
+# read-through cache for biography and roster reads
+cache_max_size = 4096
+cache_ttl = 60
+# seconds between checks for writes by other worker processes, which send cached entries to revalidation
+cache_data_version_interval = 0.005
+
+# batch biography lookups by email or ID
+bio_lookup_max_items = 200
+
+# speaker full-text search pages
+search_page_size = 20
+search_page_max_size = 100
+
+# paginated roster reads
+roster_page_size = 50
+roster_page_max_size = 500
+
+# events overview pages (the admin dashboard)
+events_page_size = 50
+events_page_max_size = 500
+
+# photo uploads: largest accepted image, copy chunk size, and the largest request body read at all
+photo_max_size = 5 * 1024 * 1024
+upload_chunk_size = 64 * 1024
+upload_max_request_size = photo_max_size + 1024 * 1024
+
+# resized photo variants, rendered in a process pool and stored by content hash under bio_save_path
+photo_variants_dir_name = 'photo_variants'
+# uploads are received here, under bio_save_path, before the write that stores them
+photo_uploads_dir_name = 'photo_uploads'
+photo_variant_sizes = {'thumbnail': 128, 'medium': 512}
+photo_variant_format = 'WEBP'
+photo_pipeline_workers = 2
+
+# snapshots are rebuilt once no write marked them stale for snapshot_debounce seconds, and at the latest
+# snapshot_max_delay seconds after the first one did
+snapshot_debounce = 2
+snapshot_max_delay = 10
+snapshot_gzip_level = 9
+snapshot_brotli_quality = 9
+
+# bulk biography import: rows per transaction, and the largest import file accepted by the endpoint
+import_batch_size = 500
+import_max_request_size = 64 * 1024 * 1024
+
+# instrumentation: latency histogram buckets (seconds), and statements logged with their query plan when slower
+# than slow_query_threshold_ms (None disables the log), to slow_query_log_file or the 'biography.slow_queries' logger
+metrics_latency_buckets = [.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10]
+slow_query_threshold_ms = 250
+slow_query_log_file = None
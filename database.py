@@ -0,0 +1,289 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from metrics import write_lock_seconds
+from utils import write_locks
+
+
+# result codes (and their extended codes) after which a connection is not handed out again; any other error,
+# e.g. a constraint violation or "database is locked", is the statement's and leaves the connection usable
+broken_connection_errors = ('SQLITE_CORRUPT', 'SQLITE_NOTADB', 'SQLITE_IOERR', 'SQLITE_CANTOPEN', 'SQLITE_NOMEM',
+                            'SQLITE_READONLY_DBMOVED')
+
+
+def is_connection_broken(error):
+    if isinstance(error, (sqlite3.InterfaceError, sqlite3.InternalError)):
+        return True
+    if isinstance(error, sqlite3.ProgrammingError) and 'closed' in str(error):
+        return True
+    return (getattr(error, 'sqlite_errorname', None) or '').startswith(broken_connection_errors)
+
+
+class DataVersion:
+    """
+    A generation number of a database that only moves when another process commits to it, so that a
+    process's caches notice those writes while handling their own through invalidation.
+
+    It is PRAGMA data_version of a connection kept for this alone, less the changes the WriteLock saw this
+    process commit while it held the cross-process lock (no other process could commit then). Without that
+    lock, e.g. lock_file=False, every commit counts. current() queries at most every `interval` seconds and
+    otherwise returns the last value without locking. None for in-memory databases.
+    """
+
+    def __init__(self, database_path, timeout=30.0, interval=0.005):
+        self.database_path = database_path
+        self.timeout = timeout
+        self.interval = interval
+        self.in_memory = database_path == ':memory:' or database_path.startswith('file:')
+        self._lock = threading.Lock()
+        self._conn = None
+        self._local = 0
+        self._local_start = None
+        self._checked = (float('-inf'), None)
+
+    def _read(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.database_path, timeout=self.timeout, check_same_thread=False)
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _update(self, value):
+        self._checked = (time.monotonic(), value - self._local)
+
+    def current(self):
+        if self.in_memory:
+            return None
+        checked_at, generation = self._checked
+        if time.monotonic() - checked_at < self.interval or not self._lock.acquire(blocking=False):
+            return generation
+        try:
+            # held still while this process commits: the change it is about to make is not another process's
+            if self._local_start is None:
+                self._update(self._read())
+            return self._checked[1]
+        finally:
+            self._lock.release()
+
+    def begin_local_write(self):
+        if not self.in_memory:
+            with self._lock:
+                self._local_start = self._read()
+                self._update(self._local_start)
+
+    def end_local_write(self):
+        if not self.in_memory:
+            with self._lock:
+                try:
+                    value = self._read()
+                    self._local += value - self._local_start
+                    self._update(value)
+                finally:
+                    self._local_start = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class WriteLock:
+    """
+    Lets one write transaction at a time run against a database, across the threads of this process and, where
+    fcntl is available, across processes through an flock on <database>-writelock. Writers then wait their turn
+    on the lock instead of polling SQLite's busy handler, whose sleeps grow to 100 ms under contention. Without
+    fcntl (or with lock_file=False) processes fall back on the connections' busy timeout.
+    While it holds the flock it tells data_version which commits are this process's own.
+    """
+
+    def __init__(self, database_path, lock_file=True, data_version=None):
+        self.in_memory = database_path == ':memory:' or database_path.startswith('file:')
+        self.path = f'{database_path}-writelock' if lock_file and fcntl is not None and not self.in_memory else None
+        self.data_version = data_version if self.path is not None else None
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def _get_file(self):
+        # a forked child must not share the parent's open file: flock locks belong to the open file
+        if self._file is None or self._pid != os.getpid():
+            self._file = open(self.path, 'ab')
+            self._pid = os.getpid()
+        return self._file
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        if self.path is not None:
+            try:
+                fcntl.flock(self._get_file().fileno(), fcntl.LOCK_EX)
+                try:
+                    if self.data_version is not None:
+                        self.data_version.begin_local_write()
+                except BaseException:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                    raise
+            except BaseException:
+                self._lock.release()
+                raise
+        write_lock_seconds.observe(time.perf_counter() - start)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.path is not None:
+                try:
+                    if self.data_version is not None:
+                        self.data_version.end_local_write()
+                finally:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SQLiteConnectionPool:
+    """
+    A bounded pool of long-lived SQLite connections shared between worker threads.
+    PRAGMAs are applied once, when a connection is opened; connections that raise an error
+    showing them broken (is_connection_broken) are closed, and their slot goes to the next
+    thread waiting for a connection, which opens a new one. transaction()
+    blocks on its connections take the pool's WriteLock. data_version tells when another
+    process has committed a write.
+    """
+
+    def __init__(self, database_path, max_size=8, timeout=30.0, pragmas=None, write_lock_file=True,
+                 data_version_interval=0.005):
+        self.database_path = database_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = pragmas or dict()
+        self.data_version = DataVersion(database_path, timeout=timeout, interval=data_version_interval)
+        self.write_lock = WriteLock(database_path, lock_file=write_lock_file, data_version=self.data_version)
+        self._idle = []
+        self._lock = threading.Lock()
+        # notified whenever a connection is returned or a slot freed
+        self._available = threading.Condition(self._lock)
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+        self._counters = {'created': 0, 'acquired': 0, 'recycled': 0, 'waits': 0, 'timeouts': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database_path, timeout=self.timeout, check_same_thread=False)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma}={value}')
+        write_locks[id(conn)] = self.write_lock
+        return conn
+
+    def _acquire(self):
+        deadline = None
+        with self._available:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError('connection pool is closed')
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    self._counters['waits'] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise sqlite3.OperationalError(f'no database connection available after {self.timeout}s')
+                self._available.wait(remaining)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except BaseException:
+                with self._available:
+                    self._size -= 1
+                    self._available.notify()
+                raise
+            with self._lock:
+                self._counters['created'] += 1
+
+        with self._lock:
+            self._in_use += 1
+            self._counters['acquired'] += 1
+        return conn
+
+    def _release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._available:
+            self._in_use -= 1
+            if not self._closed:
+                self._idle.append(conn)
+                self._available.notify()
+                return
+        self._discard(conn, in_use=False)
+
+    def _discard(self, conn, in_use=True):
+        with self._available:
+            self._size -= 1
+            if in_use:
+                self._in_use -= 1
+                self._counters['recycled'] += 1
+            self._available.notify()
+        write_locks.pop(id(conn), None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        except BaseException as ex:
+            if isinstance(ex, sqlite3.Error) and is_connection_broken(ex):
+                self._discard(conn)
+            else:
+                self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                **self._counters
+            }
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for conn in idle:
+            self._discard(conn, in_use=False)
+        self.data_version.close()
+        self.write_lock.close()
@@ -0,0 +1,134 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+from config import photo_pipeline_workers, photo_variant_format, photo_variant_sizes, photo_variants_dir_name, \
+    profile_photo_url_base
+from metrics import photo_io_seconds
+
+
+def get_file_hash(path, chunk_size=64 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_variant_path(variants_dir, photo_hash, variant):
+    return os.path.join(variants_dir, photo_hash[:2], f'{photo_hash}-{variant}.{photo_variant_format.lower()}')
+
+
+# os.path.join(profile_photo_url_base, photo_variants_dir_name, '') and the file name suffix of each variant,
+# worked out once: every roster row with a photo builds these URLs
+variant_url_base = os.path.join(profile_photo_url_base, photo_variants_dir_name, '')
+variant_suffixes = {variant: f'-{variant}.{photo_variant_format.lower()}' for variant in photo_variant_sizes}
+
+
+def get_variant_urls(photo_hash):
+    """
+    URLs of the resized variants of a photo, keyed by variant name; empty until they have been rendered.
+    """
+    if not photo_hash:
+        return {}
+    prefix = f'{variant_url_base}{photo_hash[:2]}/{photo_hash}'
+    return {variant: prefix + suffix for variant, suffix in variant_suffixes.items()}
+
+
+def render_variants(source_path, variants_dir):
+    """
+    Runs in a worker process. Variants are stored under the hash of the original's content, so rendering a
+    photo that was uploaded before (by anyone) only costs the hash. Returns the hash.
+    """
+    photo_hash = get_file_hash(source_path)
+    missing = {variant: size for variant, size in photo_variant_sizes.items()
+               if not os.path.exists(get_variant_path(variants_dir, photo_hash, variant))}
+    if not missing:
+        return photo_hash
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for variant, size in missing.items():
+            path = get_variant_path(variants_dir, photo_hash, variant)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            resized = image.copy()
+            resized.thumbnail((size, size))
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            resized.save(temp_path, format=photo_variant_format, quality=80)
+            os.replace(temp_path, path)
+    return photo_hash
+
+
+class PhotoVariantPipeline:
+    """
+    Renders thumbnail and medium variants of uploaded photos in a process pool, off the request path.
+    on_ready(biography_id, photo_name, photo_hash) is called from a background thread once a photo's variants
+    exist; until then readers keep serving the original. Without Pillow the pipeline is disabled and only
+    originals are served.
+    """
+
+    def __init__(self, variants_dir, on_ready, max_workers=photo_pipeline_workers):
+        self.variants_dir = variants_dir
+        self.on_ready = on_ready
+        self.max_workers = max_workers
+        self.enabled = Image is not None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'rendered': 0, 'failed': 0}
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the parent holds SQLite connections and thread locks
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, biography_id, photo_folder_path, photo_name):
+        if not self.enabled or not photo_name:
+            return None
+        start = time.perf_counter()
+        try:
+            future = self.get_executor().submit(render_variants, os.path.join(photo_folder_path, photo_name),
+                                                self.variants_dir)
+        except RuntimeError:
+            # a broken or shut down pool only costs the variants; the original photo is still served
+            with self._lock:
+                self._counters['failed'] += 1
+                self._executor = None
+            return None
+        with self._lock:
+            self._counters['submitted'] += 1
+
+        def done(finished):
+            # queueing in the pool included: that is how long readers wait for the variants
+            photo_io_seconds.observe(time.perf_counter() - start, operation='resize')
+            if finished.cancelled() or finished.exception() is not None:
+                with self._lock:
+                    self._counters['failed'] += 1
+                return
+            with self._lock:
+                self._counters['rendered'] += 1
+            self.on_ready(biography_id, photo_name, finished.result())
+
+        future.add_done_callback(done)
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': self.enabled, **self._counters}
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        # outside the lock: the done callbacks of pending jobs take it while shutdown waits for them
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,200 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import chain
+
+from config import keyword_index_check_interval, keyword_max_typos
+from utils import get_table_version
+
+empty_postings = array('I')
+
+
+def word_starts(text):
+    return [0] + [i + 1 for i, char in enumerate(text[:-1]) if not char.isalnum() and text[i + 1].isalnum()]
+
+
+def prefix_edit_distance(query, text, max_distance):
+    """
+    Smallest edit distance between query and any prefix of text, or max_distance + 1 when it is larger.
+    """
+    previous = list(range(len(text) + 1))
+    for i, query_char in enumerate(query, start=1):
+        current = [i]
+        for j, text_char in enumerate(text, start=1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (query_char != text_char)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous)
+
+
+def within_one_edit_prefix(query, text):
+    """
+    Fast path of prefix_edit_distance(query, text, 1) <= 1: past the first mismatch, the rest of the query
+    must line up after one substitution, deletion or insertion.
+    """
+    i = 0
+    for query_char, text_char in zip(query, text):
+        if query_char != text_char:
+            break
+        i += 1
+    if i == len(query):
+        return True
+    return (text.startswith(query[i + 1:], i + 1) or
+            text.startswith(query[i + 1:], i) or
+            text.startswith(query[i:], i + 1))
+
+
+def sorted_index(pairs):
+    pairs.sort()
+    return [key for key, _ in pairs], array('I', [position for _, position in pairs])
+
+
+class KeywordIndex:
+    """
+    In-memory search over itu_keywords for the autocomplete endpoint, ranked prefix matches first, then
+    matches at the start of a later word, then any other infix. Prefix and word-start matches come from
+    sorted key arrays (bisect); infixes from 1..gram_size character n-gram postings that are intersected
+    and then verified. The index reloads itself when the itu_keywords change counter (see migrations.py)
+    moves.
+    """
+
+    def __init__(self, gram_size=3, check_interval=keyword_index_check_interval, max_typos=keyword_max_typos,
+                 max_fuzzy_candidates=40):
+        self.gram_size = gram_size
+        self.check_interval = check_interval
+        self.max_typos = max_typos
+        self.max_fuzzy_candidates = max_fuzzy_candidates
+        self.version = None
+        # (texts, lowered texts, word starts, n-gram postings, prefix index, word index), replaced as a whole
+        self.snapshot = ([], [], [], dict(), ([], empty_postings), ([], empty_postings))
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def grams(self, text, sizes=None):
+        sizes = sizes or range(1, self.gram_size + 1)
+        return {text[i:i + size] for size in sizes for i in range(len(text) - size + 1)}
+
+    def load(self, conn):
+        version = get_table_version(conn, 'itu_keywords')
+        texts = [row[0] for row in conn.cursor().execute('SELECT KwText FROM itu_keywords ORDER BY KwText')]
+        lowered = [text.lower() for text in texts]
+        starts = [word_starts(text) for text in lowered]
+
+        positions = defaultdict(list)
+        prefixes = []
+        words = []
+        for position, text in enumerate(lowered):
+            for gram in self.grams(text):
+                positions[gram].append(position)
+            prefixes.append((text, position))
+            words.extend((text[start:], position) for start in starts[position][1:])
+        postings = {gram: array('I', values) for gram, values in positions.items()}
+
+        # searches read one snapshot, so a concurrent reload never mixes positions from two versions
+        self.snapshot = (texts, lowered, starts, postings, sorted_index(prefixes), sorted_index(words))
+        self.version = version
+        self._checked_at = time.monotonic()
+
+    def due_for_check(self):
+        return time.monotonic() - self._checked_at >= self.check_interval
+
+    def refresh(self, conn):
+        """
+        Reload the index if itu_keywords changed; the change counter is read at most every check_interval.
+        """
+        if not self.due_for_check():
+            return False
+        with self._lock:
+            if not self.due_for_check():
+                return False
+            if get_table_version(conn, 'itu_keywords') == self.version:
+                self._checked_at = time.monotonic()
+                return False
+            self.load(conn)
+            return True
+
+    def candidates(self, postings, query):
+        if len(query) <= self.gram_size:
+            return postings.get(query, empty_postings)
+        gram_postings = sorted((postings.get(gram, empty_postings)
+                                for gram in self.grams(query, sizes=[self.gram_size])), key=len)
+        if not gram_postings[0]:
+            return empty_postings
+        matches = set(gram_postings[0])
+        for posting in gram_postings[1:]:
+            matches.intersection_update(posting)
+            if not matches:
+                break
+        return matches
+
+    def fuzzy_matches(self, lowered, starts, postings, prefix_index, query, max_typos, exclude):
+        """
+        Keywords where some word starts with query within max_typos edits, as sortable
+        (distance, matched on a later word, length, position) tuples. Only a bounded number of candidates
+        is verified: keywords starting with the query's leading fragment, which holds no typo whenever the
+        typos are further right, then the keywords sharing the most n-grams with the query.
+        """
+        keys, positions = prefix_index
+        head = query[:max(1, len(query) // (max_typos + 1))]
+        start = bisect_left(keys, head)
+        pool = [positions[i] for i in range(start, min(len(keys), start + self.max_fuzzy_candidates))
+                if keys[i].startswith(head)]
+
+        query_grams = self.grams(query, sizes=[self.gram_size])
+        hits = Counter(chain.from_iterable(postings.get(gram, empty_postings) for gram in query_grams))
+        # every edit destroys at most gram_size of the query's grams
+        min_hits = max(1, len(query_grams) - self.gram_size * max_typos)
+        pool.extend(position for position, count in hits.most_common(self.max_fuzzy_candidates)
+                    if count >= min_hits)
+
+        matches = []
+        for position in dict.fromkeys(pool):
+            if position in exclude:
+                continue
+            text = lowered[position]
+            for word, start in enumerate(starts[position]):
+                window = text[start:start + len(query) + max_typos]
+                if max_typos == 1:
+                    distance = 1 if within_one_edit_prefix(query, window) else 2
+                else:
+                    distance = prefix_edit_distance(query, window, max_typos)
+                if distance <= max_typos:
+                    matches.append((distance, word > 0, len(text), position))
+                    break
+        return matches
+
+    def search(self, query, top_x=10, max_typos=None):
+        max_typos = self.max_typos if max_typos is None else max_typos
+        texts, lowered, starts, postings, prefix_index, word_index = self.snapshot
+        query = query.strip().lower()
+        if not query:
+            return texts[:top_x]
+
+        ranked = []
+        seen = set()
+        for keys, positions in [prefix_index, word_index]:
+            for i in range(bisect_left(keys, query), len(keys)):
+                if len(ranked) >= top_x or not keys[i].startswith(query):
+                    break
+                if positions[i] not in seen:
+                    seen.add(positions[i])
+                    ranked.append(positions[i])
+
+        # every prefix and word-start match is collected by now unless the list is already full
+        if len(ranked) < top_x:
+            infixes = sorted(position for position in self.candidates(postings, query)
+                             if position not in seen and query in lowered[position])
+            ranked.extend(infixes[:top_x - len(ranked)])
+            seen.update(infixes)
+
+            # typo tolerance only kicks in when the exact matches cannot fill the list
+            if len(ranked) < top_x and max_typos and len(query) > self.gram_size:
+                fuzzy = sorted(self.fuzzy_matches(lowered, starts, postings, prefix_index, query, max_typos, seen))
+                ranked.extend(match[-1] for match in fuzzy[:top_x - len(ranked)])
+
+        return [texts[position] for position in ranked]
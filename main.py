@@ -1,37 +1,224 @@
 import json
+from contextlib import asynccontextmanager
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
 
 import uvicorn
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 
+from async_backend import AsyncUserBiographySystem, ServiceOverloaded
 from backend import UserBiographySystem
+from bulk import bulk_formats, get_bulk_format
+from config import events_page_size, import_max_request_size, roster_page_size, search_page_size, \
+    upload_max_request_size
+from metrics import RequestMetricsMiddleware, render_metrics
+from utils import dump_json, form_response
 
-biography = UserBiographySystem(database_path='itu_event_biography_db.db')
-app = FastAPI()
+database_path = 'itu_event_biography_db.db'
+# built when the app starts rather than on import: the photo pipeline's spawned workers import this module too
+biography = None
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    global biography
+    biography = AsyncUserBiographySystem(UserBiographySystem(database_path=database_path))
+    try:
+        yield
+    finally:
+        biography.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetricsMiddleware)
+
+
+class RequestTooLarge(Exception):
+    def __init__(self, max_size):
+        super().__init__(f'request body is larger than {max_size} bytes')
+        self.max_size = max_size
+
+
+def request_too_large(request, max_size=upload_max_request_size):
+    # reject before the multipart body is read at all when the client announces an oversized upload
+    content_length = request.headers.get('content-length', '')
+    return content_length.isdigit() and int(content_length) > max_size
+
+
+async def read_form(request, max_size=upload_max_request_size):
+    """
+    request.form(), raising RequestTooLarge (a 413) once the body passes max_size: up front from its
+    Content-Length, or while it arrives, for a chunked upload that announces none, instead of after it
+    has been spooled whole.
+    """
+    if request_too_large(request, max_size=max_size):
+        raise RequestTooLarge(max_size)
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > max_size:
+                raise RequestTooLarge(max_size)
+        return message
+
+    return await Request(request.scope, receive).form()
+
+
+def upload_too_large_response(max_size=upload_max_request_size):
+    return JSONResponse(status_code=413,
+                        content=form_response(data={}, error_msg=f'Request body is larger than '
+                                                                 f'{max_size // 1024} KB.'))
+
+
+def get_user_photo(form_data):
+    """
+    The uploaded photo as {'filename', 'file'}; the file is Starlette's spooled upload, which the backend
+    copies to disk in chunks instead of it being read into memory here.
+    """
+    if 'photo_file' in form_data and form_data['photo_file'].filename:
+        upload = form_data['photo_file']
+        return {'filename': upload.filename, 'file': upload.file}
+    return None
+
+
+def split_fields(fields):
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def get_string_list(form_data, name):
+    # a form field holding a JSON list of strings; None when it is missing, malformed or holds anything else
+    try:
+        value = json.loads(form_data[name])
+    except (KeyError, ValueError):
+        return None
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return value
+    return None
+
+
+def is_not_modified(request, version):
+    """
+    Evaluates the request's If-None-Match (weak comparison, as for GET) or, only without it,
+    If-Modified-Since against a backend form_version.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or version['ETag'] in tags
+    if_modified_since = request.headers.get('if-modified-since')
+    if not if_modified_since or version['LastModified'] is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have whole seconds
+    return since.tzinfo is not None and version['LastModified'].replace(microsecond=0) <= since
+
+
+def version_headers(version):
+    # clients may store the response but must revalidate it, which the validators make cheap
+    headers = {'Cache-Control': 'no-cache'}
+    if version:
+        headers['ETag'] = version['ETag']
+        if version['LastModified'] is not None:
+            headers['Last-Modified'] = format_datetime(version['LastModified'], usegmt=True)
+    return headers
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSONResponse encoded with utils.dump_json. Routes returning bios return one of these, so FastAPI hands
+    it on as it is instead of walking every row with jsonable_encoder first.
+    """
+
+    def render(self, content):
+        return dump_json(content)
+
+
+def conditional_response(response, version):
+    if response is None:
+        return Response(status_code=304, headers=version_headers(version))
+    return FastJSONResponse(content=response, headers=version_headers(version))
+
+
+@app.exception_handler(RequestTooLarge)
+async def request_too_large_handler(request: Request, exc: RequestTooLarge):
+    return upload_too_large_response(max_size=exc.max_size)
+
+
+@app.exception_handler(ServiceOverloaded)
+async def service_overloaded_handler(request: Request, exc: ServiceOverloaded):
+    return JSONResponse(status_code=503,
+                        content=form_response(data={}, error_msg=str(exc)),
+                        headers={'Retry-After': str(exc.retry_after)})
 
 
 @app.get("/biography/generate_invitation")
 async def generate_invitation(even_name):
-    return biography.generate_invitation_link(event_name=even_name)
+    return await biography.generate_invitation_link(event_name=even_name)
 
 
 @app.get("/biography/retrieve_bio_by_email")
 async def retrieve_bio_by_email(user_email: str):
-    return biography.retrieve_bio_by_email(user_email=user_email)
+    return FastJSONResponse(await biography.retrieve_bio_by_email(user_email=user_email))
 
 
 @app.get("/biography/retrieve_bio_by_id")
-async def retrieve_bio_by_id(bio_id: str):
-    return biography.retrieve_bio_by_id(bio_id=bio_id)
+async def retrieve_bio_by_id(request: Request, bio_id: str):
+    response, version = await biography.retrieve_bio_by_id_if_modified(
+        bio_id, is_current=lambda stored_version: is_not_modified(request, stored_version))
+    return conditional_response(response, version)
+
+
+@app.get("/biography/retrieve_bios")
+async def retrieve_bios(emails: Optional[str] = None, bio_ids: Optional[str] = None):
+    # comma-separated emails or IDs; the response maps every input to its bio
+    return FastJSONResponse(await biography.retrieve_bios(emails=split_fields(emails),
+                                                          biography_ids=split_fields(bio_ids)))
 
 
 @app.get('/biography/get_events')
 async def get_event():
-    return biography.get_event()
+    return await biography.get_event()
+
+
+@app.get('/biography/events_overview')
+async def events_overview(limit: int = events_page_size, cursor: Optional[str] = None):
+    return FastJSONResponse(await biography.get_events_overview(limit=limit, cursor=cursor))
 
 
 @app.get('/biography/retrieve_bios_by_event')
-async def retrieve_bios_by_event(event_id: str, biography_status: str):
-    return biography.retrieve_bios_by_event(event_id, biography_status)
+async def retrieve_bios_by_event(request: Request, event_id: str, biography_status: str, limit: Optional[int] = None,
+                                 cursor: Optional[str] = None, fields: Optional[str] = None):
+    # without paging arguments the whole roster is returned, as before, and can be revalidated
+    if limit is None and cursor is None and fields is None:
+        response, version = await biography.retrieve_bios_by_event_if_modified(
+            event_id, biography_status, is_current=lambda stored_version: is_not_modified(request, stored_version))
+        return conditional_response(response, version)
+    return FastJSONResponse(await biography.retrieve_bios_by_event_page(event_id, biography_status,
+                                                                        limit=limit or roster_page_size,
+                                                                        cursor=cursor, fields=split_fields(fields)))
+
+
+@app.get('/biography/stream_bios_by_event')
+async def stream_bios_by_event(event_id: str, biography_status: str, fields: Optional[str] = None):
+    fields = split_fields(fields)
+    error_response = await biography.check_roster_stream(event_id, biography_status, fields=fields)
+    if error_response:
+        return error_response
+
+    async def ndjson_lines():
+        async for batch in biography.iter_bios_by_event(event_id, biography_status, fields=fields):
+            yield b''.join(dump_json(row) + b'\n' for row in batch)
+
+    return StreamingResponse(ndjson_lines(), media_type='application/x-ndjson')
 
 
 @app.post('/biography/append_bio_to_event')
@@ -39,7 +226,7 @@ async def append_bio_to_event(request: Request):
     form_data = await request.form()
     event_id = form_data['event_id']
     bio_email = form_data['bio_email']
-    return biography.append_bio_to_event(event_id, bio_email)
+    return await biography.append_bio_to_event(event_id, bio_email)
 
 
 @app.post('/biography/remove_bio_from_event')
@@ -47,27 +234,38 @@ async def remove_bio_from_event(request: Request):
     form_data = await request.form()
     event_id = form_data['event_id']
     bio_email = form_data['bio_email']
-    return biography.remove_bio_from_event(event_id, bio_email)
+    return await biography.remove_bio_from_event(event_id, bio_email)
+
+
+@app.post('/biography/append_bios_to_event')
+async def append_bios_to_event(request: Request):
+    # bio_emails is a JSON list
+    form_data = await request.form()
+    bio_emails = get_string_list(form_data, 'bio_emails')
+    if bio_emails is None:
+        return form_response(data={}, error_msg='bio_emails must be a JSON list of emails.')
+    return await biography.append_bios_to_event(form_data['event_id'], bio_emails)
+
+
+@app.post('/biography/remove_bios_from_event')
+async def remove_bios_from_event(request: Request):
+    form_data = await request.form()
+    bio_emails = get_string_list(form_data, 'bio_emails')
+    if bio_emails is None:
+        return form_response(data={}, error_msg='bio_emails must be a JSON list of emails.')
+    return await biography.remove_bios_from_event(form_data['event_id'], bio_emails)
 
 
 @app.post("/biography/save_bio")
 async def save_bio(request: Request):
-    form_data = await request.form()
+    form_data = await read_form(request)
 
     if 'user_data' in form_data:
         user_data = json.loads(form_data['user_data'])
     else:
         user_data = None
 
-    if 'photo_file' in form_data and form_data['photo_file'].filename:
-        user_photo = form_data['photo_file']
-        contents = await user_photo.read()  # <-- Important!
-        fn = user_photo.filename
-        user_photo = dict()
-        user_photo['filename'] = fn
-        user_photo['contents'] = contents
-    else:
-        user_photo = None
+    user_photo = get_user_photo(form_data)
 
     if 'event_id' in form_data:
         event_id = form_data['event_id']
@@ -79,45 +277,112 @@ async def save_bio(request: Request):
     else:
         photo_flag = False
 
-    response = biography.save_biography(user_data, user_photo,
-                                        event_id,
-                                        photo_flag)
+    response = await biography.save_biography(user_data, user_photo,
+                                              event_id,
+                                              photo_flag)
     return response
 
 
 @app.post("/biography/accept_bio")
 async def accept_bio(request: Request):
-    form_data = await request.form()
+    form_data = await read_form(request)
 
     if 'user_data' in form_data:
         user_data = json.loads(form_data['user_data'])
     else:
         user_data = None
 
-    if 'photo_file' in form_data and form_data['photo_file'].filename:
-        user_photo = form_data['photo_file']
-        contents = await user_photo.read()  # <-- Important!
-        fn = user_photo.filename
-        user_photo = dict()
-        user_photo['filename'] = fn
-        user_photo['contents'] = contents
-    else:
-        user_photo = None
+    user_photo = get_user_photo(form_data)
 
     if 'photo_flag' in form_data:
         photo_flag = eval(form_data['photo_flag'])
     else:
         photo_flag = False
 
-    response = biography.accept_biography(user_data, user_photo, photo_flag)
+    response = await biography.accept_biography(user_data, user_photo, photo_flag)
     return response
 
 
+@app.post("/biography/accept_bios")
+async def accept_bios(request: Request):
+    # emails and biography_ids are JSON lists; event_id accepts every pending bio of the event
+    form_data = await request.form()
+    emails = biography_ids = None
+    if 'emails' in form_data:
+        emails = get_string_list(form_data, 'emails')
+        if emails is None:
+            return form_response(data={}, error_msg='emails must be a JSON list of emails.')
+    if 'biography_ids' in form_data:
+        biography_ids = get_string_list(form_data, 'biography_ids')
+        if biography_ids is None:
+            return form_response(data={}, error_msg='biography_ids must be a JSON list of biography IDs.')
+    return await biography.accept_biographies(emails=emails, biography_ids=biography_ids,
+                                              event_id=form_data.get('event_id'))
+
+
+@app.post('/biography/import_bios')
+async def import_bios(request: Request):
+    form_data = await read_form(request, max_size=import_max_request_size)
+    if 'bios_file' not in form_data or not form_data['bios_file'].filename:
+        return form_response(data={}, error_msg='bios_file is missing.')
+
+    upload = form_data['bios_file']
+    file_format = form_data.get('format') or get_bulk_format(upload.filename)
+    return await biography.import_biographies(upload.file, file_format, form_data.get('event_id'),
+                                              biography_status=form_data.get('biography_status') or 'pending')
+
+
+@app.get('/biography/export')
+async def export(table: Optional[str] = None, event_id: Optional[str] = None,
+                 biography_status: Optional[str] = None, format: str = 'csv'):
+    error_response = await biography.check_export(table=table, event_id=event_id,
+                                                  biography_status=biography_status, file_format=format)
+    if error_response:
+        return error_response
+
+    async def lines():
+        async for batch in biography.iter_export(table=table, event_id=event_id, biography_status=biography_status,
+                                                 file_format=format):
+            yield ''.join(batch)
+
+    filename = f'{table or f"{event_id}-{biography_status}"}.{format}'
+    return StreamingResponse(lines(), media_type=bulk_formats[format],
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@app.get('/biography/search')
+async def search_bios(q: str, biography_status: str = 'validated', event_id: Optional[str] = None,
+                      country: Optional[str] = None, region: Optional[str] = None, gender: Optional[str] = None,
+                      limit: int = search_page_size, cursor: Optional[str] = None):
+    return FastJSONResponse(await biography.search_bios(q, biography_status=biography_status, event_id=event_id,
+                                                        filters={'Country': country, 'Region': region,
+                                                                 'Gender': gender},
+                                                        limit=limit, cursor=cursor))
+
+
+@app.get('/biography/bios_by_keyword')
+async def bios_by_keyword(keyword: str, biography_status: str = 'validated', event_id: Optional[str] = None,
+                          limit: int = roster_page_size, cursor: Optional[str] = None, fields: Optional[str] = None):
+    return FastJSONResponse(await biography.retrieve_bios_by_keyword(keyword, biography_status=biography_status,
+                                                                     event_id=event_id, limit=limit, cursor=cursor,
+                                                                     fields=split_fields(fields)))
+
+
+@app.get('/biography/keyword_facets')
+async def keyword_facets(event_id: str, biography_status: str = 'validated'):
+    return await biography.get_keyword_facets(event_id, biography_status=biography_status)
+
+
 @app.get('/biography/keywords')
 async def query_itu_keywords(q):
-    response = biography.get_itu_keywords(q)
+    response = await biography.get_itu_keywords(q)
     return response
 
 
+@app.get('/metrics')
+async def metrics():
+    return PlainTextResponse(render_metrics(biography.get_stats()), media_type='text/plain; version=0.0.4')
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8971, log_level="info")
@@ -0,0 +1,161 @@
+"""
+In-process metrics: request latency per route, SQL query and photo I/O timings, and the slow-query log.
+render_metrics writes them, with the pool, cache, executor and pipeline stats, in the Prometheus text format.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from config import metrics_latency_buckets, slow_query_log_file
+
+slow_query_log = logging.getLogger('biography.slow_queries')
+if slow_query_log_file:
+    _handler = logging.FileHandler(slow_query_log_file, encoding='utf-8')
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_log.addHandler(_handler)
+    slow_query_log.setLevel(logging.WARNING)
+
+
+def format_labels(label_names, label_values, extra=()):
+    pairs = [*zip(label_names, label_values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        for key, value in values:
+            yield f'{self.name}{format_labels(self.label_names, key)} {format_value(value)}'
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of durations in seconds, one series per combination of label values.
+    """
+
+    def __init__(self, name, help_text, label_names=(), buckets=metrics_latency_buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        # label values -> [count per bucket, with +Inf last], sum
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                yield f'{self.name}_bucket{format_labels(self.label_names, key, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.label_names, key)} {total!r}'
+            yield f'{self.name}_count{format_labels(self.label_names, key)} {cumulative}'
+
+
+request_seconds = Histogram('biography_request_seconds', 'Time to serve a request, until its last body byte.',
+                            ['method', 'route', 'status'])
+query_seconds = Histogram('biography_query_seconds', 'Time to run an SQL statement and fetch its rows.',
+                          ['operation', 'table'])
+photo_io_seconds = Histogram('biography_photo_io_seconds', 'Time spent storing, deleting or resizing photos.',
+                             ['operation'])
+slow_queries = Counter('biography_slow_queries_total', 'Statements slower than slow_query_threshold_ms.',
+                       ['operation', 'table'])
+write_lock_seconds = Histogram('biography_write_lock_seconds', 'Time a write transaction waited for the write lock.')
+registry = [request_seconds, query_seconds, photo_io_seconds, slow_queries, write_lock_seconds]
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording request_seconds, labelled with the route's path template (not the raw path, whose
+    query strings and IDs would make unbounded series) and the response status.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router sets scope['route'] once a route matched
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            request_seconds.observe(time.perf_counter() - start, method=scope['method'], route=route, status=status)
+
+
+def render_stats(stats):
+    """
+    Numeric stats dicts ({group: {name: value}}, e.g. a pool's stats()) as untyped samples named
+    biography_<group>_<name>.
+    """
+    for group, values in sorted(stats.items()):
+        for name, value in sorted(values.items()):
+            if isinstance(value, (bool, int, float)):
+                metric = f'biography_{group}_{name}'
+                yield f'# TYPE {metric} untyped'
+                yield f'{metric} {format_value(value)}'
+
+
+def render_metrics(stats=dict()):
+    lines = [line for metric in registry for line in metric.render()]
+    lines.extend(render_stats(stats))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,438 @@
+import sqlite3
+
+from utils import explain_query_plan, transaction
+
+biography_table_sql = """
+CREATE TABLE "{table}" (
+	"BiographyID"	TEXT NOT NULL COLLATE NOCASE,
+	"FirstName"	TEXT NOT NULL,
+	"LastName"	TEXT NOT NULL,
+	"Title"	TEXT,
+	"JobTitle"	TEXT,
+	"Email"	TEXT NOT NULL UNIQUE COLLATE NOCASE,
+	"Country"	TEXT,
+	"LinkedInPage"	TEXT,
+	"TwitterPage"	TEXT,
+	"FacebookPage"	TEXT,
+	"SocialNetworkPage"	TEXT,
+	"PersonalPhotoName"	TEXT,
+	"IEEEPage"	TEXT,
+	"CreateDate"	TEXT DEFAULT CURRENT_TIMESTAMP,
+	"LastUpdate"	TEXT,
+	"PersonalWebPage"	TEXT,
+	"Organization"	TEXT,
+	"Region"	TEXT,
+	"GoogleScholarProfile"	TEXT,
+	"Gender"	TEXT,
+	"Keywords"	TEXT,
+	"Biography"	TEXT,
+	PRIMARY KEY("BiographyID")
+)
+"""
+
+events_table_sql = """
+CREATE TABLE "{table}" (
+	"EventID"	TEXT NOT NULL COLLATE NOCASE,
+	"EventName"	TEXT NOT NULL COLLATE NOCASE,
+	"CreateDate"	TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+	PRIMARY KEY("EventID")
+)
+"""
+
+event_biography_table_sql = """
+CREATE TABLE "{table}" (
+	"EventID"	TEXT NOT NULL COLLATE NOCASE,
+	"BiographyID"	TEXT COLLATE NOCASE
+)
+"""
+
+event_biography_keyed_table_sql = """
+CREATE TABLE "{table}" (
+	"EventID"	TEXT NOT NULL COLLATE NOCASE,
+	"BiographyID"	TEXT NOT NULL COLLATE NOCASE,
+	PRIMARY KEY("EventID", "BiographyID")
+) WITHOUT ROWID
+"""
+
+
+def get_table_cols(conn, table):
+    return [row[1] for row in conn.cursor().execute(f'PRAGMA table_info("{table}")')]
+
+
+def rebuild_table(conn, table, create_sql, drop_invalid_rows=False):
+    """
+    SQLite cannot change a column's type or collation in place: create the new definition next to the old
+    table, copy the shared columns over and swap the two. With drop_invalid_rows, rows that break the new
+    constraints (duplicates, NULL keys) are skipped instead of aborting the migration.
+    """
+    new_table = f'{table}_new'
+    conn.execute(create_sql.format(table=new_table))
+    new_cols = get_table_cols(conn, new_table)
+    cols = ', '.join(f'"{col}"' for col in get_table_cols(conn, table) if col in new_cols)
+    ignore = 'OR IGNORE' if drop_invalid_rows else ''
+    conn.execute(f'INSERT {ignore} INTO "{new_table}" ({cols}) SELECT {cols} FROM "{table}"')
+    conn.execute(f'DROP TABLE "{table}"')
+    conn.execute(f'ALTER TABLE "{new_table}" RENAME TO "{table}"')
+
+
+def migration_001_nocase_keys(conn):
+    # lookups compared LOWER(col)=LOWER(:col), which no index can answer; declaring the key columns
+    # COLLATE NOCASE keeps them case-insensitive while letting plain equality use the unique indexes.
+    # event_biography held the hex IDs in INTEGER columns, whose numeric affinity also defeated the join.
+    for table in ['biography_pending', 'biography_validated']:
+        rebuild_table(conn, table, biography_table_sql)
+    rebuild_table(conn, 'events', events_table_sql)
+    rebuild_table(conn, 'event_biography', event_biography_table_sql)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_events_EventName ON events(EventName)')
+
+
+def migration_002_event_biography_keys(conn):
+    # the (EventID, BiographyID) key serves roster lookups and makes duplicate links impossible, so
+    # writers can INSERT OR IGNORE instead of checking first; the reverse index serves lookups by bio
+    rebuild_table(conn, 'event_biography', event_biography_keyed_table_sql, drop_invalid_rows=True)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_biography_BiographyID ON event_biography(BiographyID)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_events_CreateDate ON events(CreateDate)')
+
+
+def migration_003_table_versions(conn):
+    # a per-table change counter lets in-memory copies of a table (the keyword index) notice edits with
+    # a single primary key lookup instead of re-reading the table
+    conn.execute('CREATE TABLE IF NOT EXISTS table_versions ('
+                 '"TableName" TEXT NOT NULL PRIMARY KEY, "Version" INTEGER NOT NULL DEFAULT 0)')
+    conn.execute("INSERT OR IGNORE INTO table_versions (TableName, Version) VALUES ('itu_keywords', 0)")
+    for operation in ['INSERT', 'UPDATE', 'DELETE']:
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS itu_keywords_version_{operation.lower()} AFTER {operation} ON itu_keywords
+        BEGIN
+            UPDATE table_versions SET Version=Version+1 WHERE TableName='itu_keywords';
+        END
+        """)
+
+
+def migration_004_photo_hash(conn):
+    # content hash of the photo whose resized variants are ready; empty while they are being rendered
+    for table in ['biography_pending', 'biography_validated']:
+        if 'PhotoHash' not in get_table_cols(conn, table):
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "PhotoHash" TEXT')
+
+
+# biography columns covered by the speaker search, and their bm25 weights
+search_cols = ['FirstName', 'LastName', 'JobTitle', 'Organization', 'Keywords', 'Biography']
+search_weights = [10.0, 10.0, 4.0, 4.0, 6.0, 1.0]
+
+
+def migration_005_biography_search(conn):
+    # one FTS5 index per biography table, sharing its rowids. The index keeps its own copy of the text, so a
+    # missed delete can only leave a stale hit behind, never corrupt it. INSERT OR REPLACE does not fire
+    # DELETE triggers, so the BEFORE INSERT trigger drops the entries of the rows an insert will replace.
+    cols = ', '.join(search_cols)
+    new_cols = ', '.join(f'new.{col}' for col in search_cols)
+    for table in ['biography_pending', 'biography_validated']:
+        fts = f'{table}_fts'
+        conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, "
+                     f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        conn.execute(f"INSERT INTO {fts}({fts}, rank) VALUES ('rank', 'bm25({', '.join(map(str, search_weights))})')")
+        conn.execute(f'INSERT INTO {fts}(rowid, {cols}) SELECT rowid, {cols} FROM {table}')
+        # document frequency of every term, to tell which query words bm25 cannot rank by
+        conn.execute(f"CREATE VIRTUAL TABLE {fts}_vocab USING fts5vocab({fts}, 'row')")
+        conn.execute(f"""
+        CREATE TRIGGER {fts}_before_insert BEFORE INSERT ON {table}
+        BEGIN
+            DELETE FROM {fts} WHERE rowid IN (
+                SELECT rowid FROM {table} WHERE BiographyID=new.BiographyID OR Email=new.Email);
+        END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER {fts}_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_cols});
+        END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER {fts}_update AFTER UPDATE ON {table}
+        BEGIN
+            DELETE FROM {fts} WHERE rowid=old.rowid;
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_cols});
+        END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER {fts}_delete AFTER DELETE ON {table}
+        BEGIN
+            DELETE FROM {fts} WHERE rowid=old.rowid;
+        END
+        """)
+
+
+biography_keyword_table_sql = """
+CREATE TABLE "biography_keyword" (
+	"KwID"	INTEGER NOT NULL,
+	"Status"	TEXT NOT NULL,
+	"BiographyID"	TEXT NOT NULL COLLATE NOCASE,
+	PRIMARY KEY("KwID", "Status", "BiographyID")
+) WITHOUT ROWID
+"""
+
+
+def keyword_array_sql(keywords):
+    """
+    A ';'-joined Keywords value rewritten as a JSON array for json_each. Triggers cannot use a recursive CTE
+    to split it; an invalid array (e.g. with control characters) tags nothing.
+    """
+    escaped = f"replace(replace({keywords}, '\\', '\\\\'), '\"', '\\\"')"
+    array = f"""'["' || replace({escaped}, ';', '","') || '"]'"""
+    return f"CASE WHEN json_valid({array}) THEN {array} ELSE '[]' END"
+
+
+# keywords that differ only in case share their lowest KwID
+keyword_id_sql = 'SELECT min(KwID) FROM itu_keywords WHERE KwText=trim(json_each.value) COLLATE NOCASE'
+
+
+def keyword_ids_sql(keywords):
+    return f"""
+    SELECT DISTINCT ({keyword_id_sql}) AS KwID FROM json_each({keyword_array_sql(keywords)}) WHERE KwID IS NOT NULL
+    """
+
+
+def migration_006_biography_keyword(conn):
+    # Keywords stays the source of truth; biography_keyword indexes its tags by KwID for "speakers by
+    # topic" and facet queries. Like the search index it is maintained by triggers, so every writer
+    # (single and batch saves, accepts, imports) keeps it in sync.
+    conn.execute(biography_keyword_table_sql)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_biography_keyword_BiographyID '
+                 'ON biography_keyword(BiographyID, Status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_itu_keywords_KwText ON itu_keywords(KwText COLLATE NOCASE)')
+    for status in ['pending', 'validated']:
+        table = f'biography_{status}'
+        conn.execute(f"""
+        INSERT OR IGNORE INTO biography_keyword (KwID, Status, BiographyID)
+        SELECT ({keyword_id_sql}) AS KwID, '{status}', {table}.BiographyID
+         FROM {table}, json_each({keyword_array_sql(f'{table}.Keywords')})
+        WHERE KwID IS NOT NULL
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER {table}_keywords_before_insert BEFORE INSERT ON {table}
+        BEGIN
+            DELETE FROM biography_keyword WHERE Status='{status}' AND BiographyID IN (
+                SELECT BiographyID FROM {table} WHERE BiographyID=new.BiographyID OR Email=new.Email);
+        END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER {table}_keywords_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT OR IGNORE INTO biography_keyword (KwID, Status, BiographyID)
+            SELECT KwID, '{status}', new.BiographyID FROM ({keyword_ids_sql('new.Keywords')});
+        END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER {table}_keywords_update AFTER UPDATE OF BiographyID, Keywords ON {table}
+        BEGIN
+            DELETE FROM biography_keyword WHERE Status='{status}' AND BiographyID=old.BiographyID;
+            INSERT OR IGNORE INTO biography_keyword (KwID, Status, BiographyID)
+            SELECT KwID, '{status}', new.BiographyID FROM ({keyword_ids_sql('new.Keywords')});
+        END
+        """)
+        conn.execute(f"""
+        CREATE TRIGGER {table}_keywords_delete AFTER DELETE ON {table}
+        BEGIN
+            DELETE FROM biography_keyword WHERE Status='{status}' AND BiographyID=old.BiographyID;
+        END
+        """)
+
+
+# millisecond UTC timestamps, so that Last-Modified and the ETag revisions move together
+now_sql = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def migration_007_change_tracking(conn):
+    # every write of a bio stamps LastUpdate and a Revision drawn from one counter shared by both tables
+    # (unlike a timestamp it cannot repeat, even across INSERT OR REPLACE), and bumps the RosterVersion of
+    # the bio's events; linking or unlinking a bio bumps its event. These strong validators let the
+    # conditional GETs answer 304 from a primary key lookup.
+    conn.execute("INSERT OR IGNORE INTO table_versions (TableName, Version) VALUES ('biography', 0)")
+    for col, definition in [('RosterVersion', 'INTEGER NOT NULL DEFAULT 0'), ('RosterUpdate', 'TEXT')]:
+        if col not in get_table_cols(conn, 'events'):
+            conn.execute(f'ALTER TABLE events ADD COLUMN "{col}" {definition}')
+    cols = ', '.join(search_cols)
+    new_cols = ', '.join(f'new.{col}' for col in search_cols)
+    bump_events = f"UPDATE events SET RosterVersion=RosterVersion+1, RosterUpdate={now_sql} WHERE EventID"
+    for table in ['biography_pending', 'biography_validated']:
+        # re-index only when searched text changes, not on every stamp (nor on the backfill below)
+        fts = f'{table}_fts'
+        conn.execute(f'DROP TRIGGER {fts}_update')
+        conn.execute(f"""
+        CREATE TRIGGER {fts}_update AFTER UPDATE OF {cols} ON {table}
+        BEGIN
+            DELETE FROM {fts} WHERE rowid=old.rowid;
+            INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new_cols});
+        END
+        """)
+        if 'Revision' not in get_table_cols(conn, table):
+            conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "Revision" INTEGER NOT NULL DEFAULT 0')
+        conn.execute(f'UPDATE "{table}" SET LastUpdate=coalesce(LastUpdate, CreateDate, {now_sql})')
+        stamp = f"""
+            UPDATE table_versions SET Version=Version+1 WHERE TableName='biography';
+            UPDATE {table} SET LastUpdate={now_sql},
+                               Revision=(SELECT Version FROM table_versions WHERE TableName='biography')
+            WHERE rowid=new.rowid;
+            {bump_events} IN (SELECT EventID FROM event_biography WHERE BiographyID=new.BiographyID);
+        """
+        conn.execute(f'CREATE TRIGGER {table}_revision_insert AFTER INSERT ON {table} BEGIN {stamp} END')
+        # the stamp itself changes Revision, which ends the recursion
+        conn.execute(f'CREATE TRIGGER {table}_revision_update AFTER UPDATE ON {table} '
+                     f'WHEN new.Revision IS old.Revision BEGIN {stamp} END')
+        conn.execute(f"""
+        CREATE TRIGGER {table}_revision_delete AFTER DELETE ON {table}
+        BEGIN
+            {bump_events} IN (SELECT EventID FROM event_biography WHERE BiographyID=old.BiographyID);
+        END
+        """)
+    for operation, row in [('INSERT', 'new'), ('DELETE', 'old')]:
+        conn.execute(f"""
+        CREATE TRIGGER event_biography_version_{operation.lower()} AFTER {operation} ON event_biography
+        BEGIN
+            {bump_events}={row}.EventID;
+        END
+        """)
+    # the last write to a roster so far is that of its latest bio (or, without bios, the event's creation),
+    # not the time of this migration
+    conn.execute("""
+    UPDATE events SET RosterUpdate=coalesce((
+        SELECT max(biography.LastUpdate)
+         FROM event_biography CROSS JOIN (SELECT BiographyID, LastUpdate FROM biography_pending
+                                          UNION ALL SELECT BiographyID, LastUpdate FROM biography_validated)
+                              AS biography
+        WHERE event_biography.EventID=events.EventID AND biography.BiographyID=event_biography.BiographyID
+    ), CreateDate)
+    WHERE RosterUpdate IS NULL
+    """)
+
+
+def migration_008_events_page_order(conn):
+    # the events overview pages by (CreateDate, EventID); EventID makes the order total, and the old
+    # CreateDate index is a prefix of the new one
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_events_CreateDate_EventID ON events(CreateDate, EventID)')
+    conn.execute('DROP INDEX IF EXISTS idx_events_CreateDate')
+
+
+migrations = [
+    (1, 'case-insensitive key columns', migration_001_nocase_keys),
+    (2, 'event_biography primary key and indexes', migration_002_event_biography_keys),
+    (3, 'table change counters', migration_003_table_versions),
+    (4, 'photo variant hash', migration_004_photo_hash),
+    (5, 'biography full-text search', migration_005_biography_search),
+    (6, 'biography keyword index', migration_006_biography_keyword),
+    (7, 'biography and roster change tracking', migration_007_change_tracking),
+    (8, 'events page order index', migration_008_events_page_order),
+]
+
+
+def get_schema_version(conn):
+    return conn.cursor().execute('PRAGMA user_version').fetchone()[0]
+
+
+def apply_migrations(conn):
+    """
+    Apply every migration newer than the database's PRAGMA user_version, each in its own transaction.
+    Returns the list of applied versions.
+    """
+    applied = []
+    for version, description, migration in migrations:
+        if version <= get_schema_version(conn):
+            continue
+        with transaction(conn):
+            # checked again under the write lock: another worker process may have applied it meanwhile
+            if version <= get_schema_version(conn):
+                continue
+            migration(conn)
+            conn.execute(f'PRAGMA user_version={version}')
+        applied.append(version)
+    return applied
+
+
+# queries on the request path, the tables each of them must reach through an index and whether
+# their ORDER BY must be answered by an index rather than a temporary sort
+hot_queries = [
+    ('biography_pending by Email',
+     'SELECT BiographyID FROM biography_pending WHERE Email=:Email', {'Email': ''}, ['biography_pending'], False),
+    ('biography_validated by Email',
+     'SELECT BiographyID FROM biography_validated WHERE Email=:Email', {'Email': ''}, ['biography_validated'],
+     False),
+    ('biography_validated by BiographyID',
+     'SELECT Email FROM biography_validated WHERE BiographyID=:BiographyID', {'BiographyID': ''},
+     ['biography_validated'], False),
+    ('events by EventID',
+     'SELECT EventID FROM events WHERE EventID=:EventID', {'EventID': ''}, ['events'], False),
+    ('events by EventName',
+     'SELECT EventID FROM events WHERE EventName=:EventName', {'EventName': ''}, ['events'], False),
+    ('events by CreateDate',
+     'SELECT EventName, EventID FROM events WHERE  1=1  order by CreateDate DESC ', {}, [], True),
+    ('event_biography link',
+     'SELECT BiographyID FROM event_biography WHERE EventID=:EventID AND BiographyID=:BiographyID',
+     {'EventID': '', 'BiographyID': ''}, ['event_biography'], False),
+    ('event_biography by BiographyID',
+     'SELECT EventID FROM event_biography WHERE BiographyID=:BiographyID', {'BiographyID': ''},
+     ['event_biography'], False),
+    ('biography_pending by Email list',
+     'SELECT BiographyID FROM biography_pending WHERE Email IN (SELECT value FROM json_each(:items))',
+     {'items': '[]'}, ['biography_pending'], False),
+    ('biography_pending by BiographyID list',
+     'SELECT Email FROM biography_pending WHERE BiographyID IN (SELECT value FROM json_each(:items))',
+     {'items': '[]'}, ['biography_pending'], False),
+    ('biographies by email list',
+     'SELECT json_each.value, biography_validated.BiographyID, biography_pending.BiographyID FROM json_each(:emails) '
+     'LEFT JOIN biography_validated ON biography_validated.Email=json_each.value '
+     'LEFT JOIN biography_pending ON biography_pending.Email=json_each.value',
+     {'emails': '[]'}, ['biography_validated', 'biography_pending'], False),
+    ('speakers by keyword',
+     'SELECT biography_validated.Email FROM biography_keyword CROSS JOIN biography_validated '
+     "WHERE biography_keyword.KwID=:KwID AND biography_keyword.Status='validated' "
+     'AND biography_validated.BiographyID=biography_keyword.BiographyID',
+     {'KwID': 0}, ['biography_keyword', 'biography_validated'], False),
+    ('keyword facets of an event',
+     'SELECT biography_keyword.KwID, count(*) FROM event_biography CROSS JOIN biography_keyword '
+     "WHERE event_biography.EventID=:EventID AND biography_keyword.Status='validated' "
+     'AND biography_keyword.BiographyID=event_biography.BiographyID GROUP BY biography_keyword.KwID',
+     {'EventID': ''}, ['event_biography', 'biography_keyword'], False),
+    ('keyword by text',
+     'SELECT min(KwID) FROM itu_keywords WHERE KwText=:KwText COLLATE NOCASE', {'KwText': ''}, ['itu_keywords'],
+     False),
+    ('events overview page',
+     'SELECT EventID FROM events WHERE (CreateDate, EventID) < (:CreateDate, :EventID) '
+     'ORDER BY CreateDate DESC, EventID DESC LIMIT 10', {'CreateDate': '', 'EventID': ''}, ['events'], True),
+    ('events overview counts',
+     'SELECT count(biography_pending.BiographyID), count(biography_validated.BiographyID) FROM event_biography '
+     'LEFT JOIN biography_pending ON biography_pending.BiographyID=event_biography.BiographyID '
+     'LEFT JOIN biography_validated ON biography_validated.BiographyID=event_biography.BiographyID '
+     'WHERE event_biography.EventID=:EventID',
+     {'EventID': ''}, ['event_biography', 'biography_pending', 'biography_validated'], False),
+    ('validated roster join',
+     'SELECT biography_validated.Email FROM event_biography CROSS JOIN biography_validated '
+     'WHERE biography_validated.BiographyID=event_biography.BiographyID AND event_biography.EventID=:EventID',
+     {'EventID': ''}, ['event_biography', 'biography_validated'], False),
+]
+
+
+def check_query_plans(conn):
+    """
+    Run EXPLAIN QUERY PLAN on the hot queries and return those that scan a table they should seek into
+    or sort rows they should read in index order.
+    """
+    offenders = []
+    for name, sql, params, tables, ordered in hot_queries:
+        plan = explain_query_plan(conn, sql, params)
+        scans = any(step.startswith(f'SCAN {table}') for step in plan for table in tables)
+        sorts = ordered and any('TEMP B-TREE' in step for step in plan)
+        if scans or sorts:
+            offenders.append({'query': name, 'plan': plan})
+    return offenders
+
+
+if __name__ == "__main__":
+    import sys
+
+    db_conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else 'itu_event_biography_db.db')
+    print(f'applied migrations: {apply_migrations(db_conn)}; schema version {get_schema_version(db_conn)}')
+    scans = check_query_plans(db_conn)
+    for scan in scans:
+        print(f'{scan["query"]} is not using an index: {scan["plan"]}')
+    sys.exit(1 if scans else 0)
@@ -0,0 +1,229 @@
+"""
+Static snapshots of the validated data, for the web server to serve without the backend: every event's
+validated roster and every validated bio as JSON, next to its gzip (and, with the brotli package, brotli)
+encoding, under snapshot_save_path:
+
+    events/<EventID>.json[.gz|.br]    the body of retrieve_bios_by_event for the validated roster
+    bios/<BiographyID>.json[.gz|.br]  the body of retrieve_bio_by_id
+
+    python snapshots.py    rebuilds every snapshot of itu_event_biography_db.db
+"""
+import gzip
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from config import snapshot_brotli_quality, snapshot_debounce, snapshot_gzip_level, snapshot_max_delay
+from utils import dump_json
+
+snapshot_kinds = ['events', 'bios']
+snapshot_log = logging.getLogger('biography.snapshots')
+
+
+def get_encodings(data):
+    """
+    {file suffix: content} of a snapshot; gzip without a timestamp, so unchanged data gives unchanged files.
+    """
+    encodings = {'': data, '.gz': gzip.compress(data, compresslevel=snapshot_gzip_level, mtime=0)}
+    if brotli is not None:
+        encodings['.br'] = brotli.compress(data, quality=snapshot_brotli_quality)
+    return encodings
+
+
+def replace_file(path, content):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class SnapshotPublisher:
+    """
+    Rebuilds the snapshots of the events and bios marked stale from a background thread. Rebuilds are debounced:
+    they start once no item was marked for `debounce` seconds (or `max_delay` seconds after the first mark), so a
+    burst of writes to one roster rebuilds it once. loaders[kind](item_id) returns (response, version) like the
+    uncached backend reads; a None version (or an error) means the item is gone and its files are removed.
+    list_items() returns {kind: [item_id, ...]} of every item, for mark_all.
+    """
+
+    def __init__(self, snapshots_dir, loaders, list_items, debounce=snapshot_debounce, max_delay=snapshot_max_delay):
+        self.snapshots_dir = snapshots_dir
+        self.loaders = loaders
+        self.list_items = list_items
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.enabled = bool(snapshots_dir)
+        self._condition = threading.Condition()
+        self._stale = {kind: set() for kind in snapshot_kinds}
+        self._first_mark = self._last_mark = None
+        self._thread = None
+        self._closed = False
+        self._counters = {'marked': 0, 'written': 0, 'unchanged': 0, 'removed': 0, 'failed': 0, 'rebuilds': 0}
+
+    def mark(self, kind, item_ids):
+        item_ids = {item_id.lower() for item_id in item_ids if item_id}
+        if not self.enabled or not item_ids:
+            return
+        with self._condition:
+            if self._closed:
+                return
+            self._stale[kind] |= item_ids
+            self._counters['marked'] += len(item_ids)
+            now = time.monotonic()
+            self._first_mark = self._first_mark or now
+            self._last_mark = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='biography-snapshots', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def mark_all(self):
+        if self.enabled:
+            for kind, item_ids in self.list_items().items():
+                self.mark(kind, item_ids)
+
+    def _take_stale(self, wait=True):
+        with self._condition:
+            while wait and not self._closed:
+                if self._last_mark is None:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                due = min(self._last_mark + self.debounce, self._first_mark + self.max_delay)
+                if now >= due:
+                    break
+                self._condition.wait(due - now)
+            stale = {kind: sorted(item_ids) for kind, item_ids in self._stale.items()}
+            self._stale = {kind: set() for kind in snapshot_kinds}
+            self._first_mark = self._last_mark = None
+            return stale
+
+    def _run(self):
+        while not self._closed:
+            # rebuild never raises, so the thread outlives a failed rebuild and keeps publishing later marks
+            self.rebuild(self._take_stale())
+
+    def flush(self):
+        """
+        Rebuilds whatever is marked stale now, in the calling thread.
+        """
+        self.rebuild(self._take_stale(wait=False))
+
+    def rebuild(self, stale):
+        """
+        Publishes the stale items. Errors are logged and counted as failed, never raised: a failed item stays as
+        it was on disk until its next write marks it again.
+        """
+        if not any(stale.values()):
+            return
+        unpublished = sum(map(len, stale.values()))
+        try:
+            os.makedirs(self.snapshots_dir, exist_ok=True)
+            with self._publish_lock():
+                for kind, item_ids in stale.items():
+                    for item_id in item_ids:
+                        try:
+                            outcome = self.publish(kind, item_id)
+                        except Exception:
+                            snapshot_log.exception('could not publish the %s snapshot %s', kind, item_id)
+                            outcome = 'failed'
+                        unpublished -= 1
+                        with self._condition:
+                            self._counters[outcome] += 1
+        except Exception:
+            # e.g. a snapshots_dir that cannot be created or locked
+            snapshot_log.exception('could not publish snapshots to %s', self.snapshots_dir)
+        with self._condition:
+            self._counters['failed'] += unpublished
+            self._counters['rebuilds'] += 1
+
+    def _publish_lock(self):
+        """
+        Worker processes publish one at a time, each loading and writing an item under the lock, so an older
+        read can never overwrite the snapshot of a newer one.
+        """
+        return FileLock(os.path.join(self.snapshots_dir, '.publish-lock') if fcntl is not None else None)
+
+    def publish(self, kind, item_id):
+        response, version = self.loaders[kind](item_id)
+        path = os.path.join(self.snapshots_dir, kind, f'{item_id}.json')
+        if version is None or response['error_msg']:
+            removed = False
+            for suffix in ['', '.gz', '.br']:
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+                    removed = True
+            return 'removed' if removed else 'unchanged'
+
+        data = dump_json(response)
+        try:
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return 'unchanged'
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the encodings first: the plain file is the one compared on the next rebuild
+        for suffix, content in sorted(get_encodings(data).items(), reverse=True):
+            replace_file(path + suffix, content)
+        return 'written'
+
+    def stats(self):
+        with self._condition:
+            return {'enabled': self.enabled, 'stale': sum(map(len, self._stale.values())), **self._counters}
+
+    def close(self):
+        # pending marks are published before the process goes away
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        if self.enabled:
+            self.flush()
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if self.path is not None:
+            self._file = open(self.path, 'ab')
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+if __name__ == "__main__":
+    from backend import UserBiographySystem
+
+    biography_system = UserBiographySystem(database_path='itu_event_biography_db.db')
+    try:
+        biography_system.snapshots.mark_all()
+        biography_system.snapshots.flush()
+        print(biography_system.snapshots.stats())
+    finally:
+        biography_system.close()
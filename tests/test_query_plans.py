@@ -0,0 +1,20 @@
+import os
+import shutil
+import sqlite3
+
+from migrations import apply_migrations, check_query_plans, get_schema_version, migrations
+
+shipped_database = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'itu_event_biography_db.db')
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    database_path = str(tmp_path / 'itu_event_biography_db.db')
+    shutil.copyfile(shipped_database, database_path)
+    conn = sqlite3.connect(database_path)
+    try:
+        apply_migrations(conn)
+        assert get_schema_version(conn) == migrations[-1][0]
+        assert check_query_plans(conn) == []
+    finally:
+        conn.close()
@@ -1,13 +1,61 @@
+import base64
+import json
+import re
+import sqlite3
 import time
 import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
 
-from config import ALLOWED_PHOTO_EXTENSIONS
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from config import ALLOWED_PHOTO_EXTENSIONS, slow_query_threshold_ms
+from metrics import query_seconds, slow_queries, slow_query_log
+
+
+# leading bytes of each allowed image type; extensions of the same type share a signature
+photo_signatures = {
+    'png': b'\x89PNG\r\n\x1a\n',
+    'jpg': b'\xff\xd8\xff',
+    'jpeg': b'\xff\xd8\xff',
+}
+
+
+# ids of the connections inside a transaction() block, whose write helpers must not commit on their own
+open_transactions = set()
+# id of a pooled connection -> the WriteLock of its database, held by transaction() blocks (see database.py)
+write_locks = dict()
+
+
+class PhotoUploadError(ValueError):
+    pass
 
 
 def allowed_photo_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_PHOTO_EXTENSIONS
 
 
+def get_photo_type_by_extension(extension):
+    extension = extension.lower().lstrip('.')
+    if extension not in ALLOWED_PHOTO_EXTENSIONS:
+        return None
+    return get_photo_type(photo_signatures.get(extension, b''))
+
+
+def get_photo_type(first_bytes):
+    """
+    The allowed extension whose signature first_bytes starts with, or None.
+    """
+    for extension in sorted(ALLOWED_PHOTO_EXTENSIONS):
+        signature = photo_signatures.get(extension)
+        if signature and first_bytes.startswith(signature):
+            return extension
+    return None
+
+
 def str2list(input_str):
     if input_str is None:
         return []
@@ -20,61 +68,149 @@ def list2str(input_list):
     return ';'.join(input_list)
 
 
-def sqlite_select(conn, table, cols, conds=dict(), sort_by=str()):
+def get_where_cond(conds):
+    """
+    Key columns are declared COLLATE NOCASE (see migrations.py), so a plain equality is already
+    case-insensitive and can be answered from the column's index.
+    """
     if conds:
-        if len(conds) > 1:
-            where_cond = ' AND '.join(f'LOWER({cond})=LOWER(:{cond})' for cond in conds.keys())
+        return ' AND '.join(f'{cond}=:{cond}' for cond in conds.keys())
+    return ' 1=1 '
+
+
+@contextmanager
+def transaction(conn):
+    """
+    Run the block as one BEGIN IMMEDIATE ... COMMIT: the write lock is taken before the reads that decide
+    what to write, and sqlite_insert/update/delete join the transaction instead of committing each
+    statement. Rolls back if the block raises; a nested block joins the outer transaction. On a pooled
+    connection the block first takes its database's write lock, so writers queue for it in turn.
+    """
+    if id(conn) in open_transactions:
+        yield conn
+        return
+    with write_locks.get(id(conn)) or nullcontext():
+        conn.execute('BEGIN IMMEDIATE')
+        open_transactions.add(id(conn))
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
         else:
-            where_cond = ' '.join(f'LOWER({cond})=LOWER(:{cond})' for cond in conds.keys())
-    else:
-        where_cond = ' 1=1 '
+            conn.commit()
+        finally:
+            open_transactions.discard(id(conn))
+
+
+def commit_statement(conn):
+    if id(conn) not in open_transactions:
+        conn.commit()
+
+
+def get_search_words(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def get_match_query(words):
+    """
+    FTS5 MATCH expression for the words typed by a user: every word must occur, the last one as a prefix
+    (it may still be typed). Words are quoted, so FTS5 operators in the text are matched literally.
+    """
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def explain_query_plan(conn, sql, params=dict()):
+    return [row[-1] for row in conn.cursor().execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+@contextmanager
+def timed_query(conn, operation, table, sql, params=dict()):
+    """
+    Records the duration of the block, which runs sql, in query_seconds. Statements slower than
+    slow_query_threshold_ms are logged with their query plan; the parameters are left out of the log,
+    since they hold personal data.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        query_seconds.observe(elapsed, operation=operation, table=table)
+        if slow_query_threshold_ms is not None and elapsed * 1000 >= slow_query_threshold_ms:
+            slow_queries.inc(operation=operation, table=table)
+            try:
+                plan = explain_query_plan(conn, sql, params) or ['(no plan steps)']
+            except sqlite3.Error as ex:
+                plan = [f'unavailable: {ex}']
+            slow_query_log.warning('slow %s on %s: %.1f ms\n%s\nquery plan:\n  %s', operation, table,
+                                   elapsed * 1000, sql.strip(), '\n  '.join(plan))
+
+
+def sqlite_select(conn, table, cols, conds=dict(), sort_by=str()):
+    where_cond = get_where_cond(conds)
 
     sql = f'SELECT {", ".join(cols)} FROM {table} WHERE {where_cond}'
 
     if sort_by:
         sql = sql + f' order by {sort_by} DESC '
-    result = conn.cursor().execute(sql, conds)
-    return get_list_of_dict(keys=cols, list_of_tuples=result)
+    with timed_query(conn, 'select', table, sql, conds):
+        result = conn.cursor().execute(sql, conds)
+        return get_list_of_dict(keys=cols, list_of_tuples=result)
 
 
-def sqlite_insert(conn, table, rows, replace_existing=False):
+def sqlite_insert(conn, table, rows, replace_existing=False, ignore_existing=False):
     cols = ', '.join('"{}"'.format(col) for col in rows.keys())
     vals = ', '.join(':{}'.format(col) for col in rows.keys())
     replace = ''
     if replace_existing:
         replace = 'OR REPLACE'
+    elif ignore_existing:
+        replace = 'OR IGNORE'
     sql = f'INSERT {replace} INTO "{table}" ({cols}) VALUES ({vals})'
 
-    affected_rows = conn.cursor().execute(sql, rows)
-    conn.commit()
+    with timed_query(conn, 'insert', table, sql, rows):
+        affected_rows = conn.cursor().execute(sql, rows)
+    commit_statement(conn)
     return affected_rows.rowcount
 
 
 def sqlite_update(conn, table, rows, conds):
     vals = ', '.join(f'{col}=:{col}' for col in rows.keys())
-    where_cond = ', '.join(f'LOWER({cond})=LOWER(:{cond})' for cond in conds.keys())
+    where_cond = get_where_cond(conds)
     sql = f'UPDATE  "{table}" SET {vals} WHERE {where_cond}'
 
-    affected_rows = conn.cursor().execute(sql, {**rows, **conds})
-    conn.commit()
+    with timed_query(conn, 'update', table, sql, {**rows, **conds}):
+        affected_rows = conn.cursor().execute(sql, {**rows, **conds})
+    commit_statement(conn)
     return affected_rows.rowcount
 
 
 def sqlite_delete(conn, table, conds):
-    if conds:
-        if len(conds) > 1:
-            where_cond = ' AND '.join(f'LOWER({cond})=LOWER(:{cond})' for cond in conds.keys())
-        else:
-            where_cond = ' '.join(f'LOWER({cond})=LOWER(:{cond})' for cond in conds.keys())
-    else:
-        where_cond = ' 1=1 '
+    where_cond = get_where_cond(conds)
 
     sql = f'DELETE FROM {table} WHERE {where_cond}'
-    affected_rows = conn.cursor().execute(sql, conds)
-    conn.commit()
+    with timed_query(conn, 'delete', table, sql, conds):
+        affected_rows = conn.cursor().execute(sql, conds)
+    commit_statement(conn)
     return affected_rows.rowcount
 
 
+def get_table_version(conn, table):
+    result = conn.cursor().execute('SELECT Version FROM table_versions WHERE TableName=?', (table,)).fetchone()
+    return result[0] if result else 0
+
+
+def dump_json(content):
+    """
+    Compact UTF-8 JSON bytes of plain data (dicts, lists, strings, numbers, None), with orjson when it is
+    installed: it encodes a large roster many times faster than the json module.
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode()
+
+
 def get_list_of_dict(keys, list_of_tuples):
     """
     This function will accept keys and list_of_tuples as args and return list of dicts
@@ -83,10 +219,38 @@ def get_list_of_dict(keys, list_of_tuples):
     return list_of_dict
 
 
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns the list of values stored in a cursor made by encode_cursor, or None if it is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+    # the values are bound as query parameters, which must be scalars
+    if not isinstance(values, list) or not all(value is None or isinstance(value, (str, int, float))
+                                               for value in values):
+        return None
+    return values
+
+
 def generate_id(key):
     return uuid.uuid5(uuid.NAMESPACE_DNS, str(key) + str(time.time())).hex
 
 
+def form_version(revision, last_update):
+    """
+    Validators of a stored representation: a strong ETag from its revision counter, and its LastUpdate
+    (stored as UTC 'YYYY-MM-DD HH:MM:SS[.fff]') as an aware datetime.
+    """
+    last_modified = datetime.fromisoformat(last_update).replace(tzinfo=timezone.utc) if last_update else None
+    return {'ETag': f'"{revision}"', 'LastModified': last_modified}
+
+
 def form_response(data, error_msg='', success_msg=''):
     return {
         'data': data,